@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Методы, которые в ответ возвращают отправленное сообщение
+MESSAGE_METHODS = {
+    "sendMessage",
+    "sendDocument",
+    "editMessageText",
+    "editMessageReplyMarkup",
+}
+
+
+class FakeBotAPI:
+    """
+    Локальная замена api.telegram.org для бенчмарков: принимает любые
+    методы Bot API, отвечает правдоподобным результатом и считает вызовы.
+    latency — искусственная задержка ответа (сек), чтобы имитировать сеть.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.uploaded_bytes = 0
+        self._message_id = 0
+        self._file_id = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.uploaded_bytes = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Запускает сервер и возвращает его базовый URL для TelegramAPIServer.from_base().
+        """
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _message(self, data: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(data.get("chat_id") or 1)
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+        }
+        if "text" in data:
+            message["text"] = data["text"]
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+
+        data = {}
+        post = await request.post()
+        for key, value in post.items():
+            if isinstance(value, web.FileField):
+                self.uploaded_bytes += len(value.file.read())
+            else:
+                data[key] = value
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in MESSAGE_METHODS:
+            result = self._message(data)
+            if method == "sendDocument":
+                self._file_id += 1
+                result["document"] = {
+                    "file_id": data.get("document") or f"FILE{self._file_id}",
+                    "file_unique_id": f"U{self._file_id}",
+                }
+                if result["document"]["file_id"].startswith("attach://"):
+                    result["document"]["file_id"] = f"FILE{self._file_id}"
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench"}
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,203 @@
+"""
+Генератор синтетической базы обращений для нагрузочных тестов отчётов.
+
+    python -m bench.gen_tickets bench_tickets.db --rows 1000000 --years 5
+
+Схема создаётся теми же миграциями, что и у бота (bot_core.MIGRATIONS).
+Распределения перекошены, как в жизни: несколько спектаклей, площадка
+и сотрудников встречаются гораздо чаще остальных, обращений больше
+по выходным и меньше летом, тексты разной длины.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+# Сколько строк вставляется одной транзакцией
+BATCH = 50_000
+
+PROBLEMS = [
+    "Пропал звук в радиомикрофоне",
+    "Фонит петличка у актёра",
+    "Не запустилась фонограмма",
+    "Треск в левом портале",
+    "Пульт перезагрузился посреди сцены",
+    "Не работает мониторная линия",
+    "Села батарейка в передатчике",
+    "Опоздал звуковой эффект",
+    "Громкость музыки скачет",
+    "Нет связи с помрежем по интеркому",
+    "Гул в сабвуфере",
+    "Радиосистема ловит помехи",
+]
+
+CAUSES = [
+    "Не заменили батарейки перед спектаклем",
+    "Перебит кабель под планшетом сцены",
+    "Сбился сценарий на пульте",
+    "Разъём окислился",
+    "Помехи от световых приборов",
+    "Актёр задел капсюль костюмом",
+    "Ошибка в партитуре QLab",
+    "Перегрелся усилитель",
+    "Не проверили линию на саундчеке",
+    "Износ микрофонного кабеля",
+]
+
+DETAILS = [
+    "во втором акте",
+    "на поклонах",
+    "сразу после антракта",
+    "в начале спектакля",
+    "в сцене с музыкой",
+    "на крупном плане",
+    "при выходе хора",
+    "повторялось несколько раз",
+    "зрители заметили",
+    "исправили по ходу",
+]
+
+# Относительная частота обращений по дням недели (пн..вс) и месяцам (янв..дек)
+WEEKDAY_WEIGHTS = [0.6, 0.7, 0.8, 0.9, 1.2, 1.6, 1.5]
+MONTH_WEIGHTS = [1.0, 1.0, 1.1, 1.1, 1.0, 0.8, 0.2, 0.3, 1.0, 1.2, 1.2, 1.3]
+
+
+def zipf_weights(n: int, s: float, rng: random.Random) -> list[float]:
+    """
+    Веса 1/k^s в случайном порядке: кто-то очень «популярен», большинство — нет.
+    """
+    weights = [1 / (k ** s) for k in range(1, n + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+def text(rng: random.Random, pool: list[str]) -> str:
+    parts = [rng.choice(pool)]
+    parts += rng.sample(DETAILS, rng.choices([0, 1, 2, 3], weights=[4, 3, 2, 1])[0])
+    result = ", ".join(parts)
+    if rng.random() < 0.1:
+        # Изредка — длинное подробное описание
+        result += ". " + ". ".join(rng.choice(pool + DETAILS) for _ in range(rng.randint(5, 20)))
+    return result
+
+
+def generate(core, path: str, rows: int, years: int, seed: int) -> None:
+    rng = random.Random(seed)
+
+    today = date.today()
+    first = today - timedelta(days=365 * years)
+    days = [first + timedelta(days=i) for i in range((today - first).days + 1)]
+    day_cum = list(accumulate(
+        WEEKDAY_WEIGHTS[d.weekday()] * MONTH_WEIGHTS[d.month - 1] for d in days
+    ))
+
+    venue_cum = list(accumulate([0.65, 0.35]))
+    plays_by_venue = {
+        core.VENUES[0]: (core.PLAYS_BRONNAYA, list(accumulate(zipf_weights(len(core.PLAYS_BRONNAYA), 1.1, rng)))),
+        core.VENUES[1]: (core.PLAYS_MELNIKOV, list(accumulate(zipf_weights(len(core.PLAYS_MELNIKOV), 1.1, rng)))),
+    }
+    employee_cum = list(accumulate(zipf_weights(len(core.EMPLOYEES), 0.9, rng)))
+    users = [(100000 + i, f"user{i}") for i in range(40)]
+    user_cum = list(accumulate(zipf_weights(len(users), 1.0, rng)))
+
+    with core.db.writer() as conn:
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tickets").fetchone()[0] + 1
+
+    start = time.perf_counter()
+    done = 0
+    while done < rows:
+        n = min(BATCH, rows - done)
+        tickets = []
+        links = []
+        batch = zip(
+            range(next_id, next_id + n),
+            rng.choices(days, cum_weights=day_cum, k=n),
+            rng.choices(core.VENUES, cum_weights=venue_cum, k=n),
+            rng.choices(users, cum_weights=user_cum, k=n),
+            rng.choices([1, 2, 3], weights=[6, 3, 1], k=n),
+        )
+        for ticket_id, day, venue, (user_id, username), employees_count in batch:
+            plays, play_cum = plays_by_venue[venue]
+            play = rng.choices(plays, cum_weights=play_cum)[0]
+            employees = sorted(set(rng.choices(
+                core.EMPLOYEES, cum_weights=employee_cum, k=employees_count
+            )))
+            created_at = datetime.combine(day, datetime.min.time()) + timedelta(
+                hours=rng.randint(18, 23), minutes=rng.randint(0, 59), seconds=rng.randint(0, 59)
+            )
+            tickets.append((
+                ticket_id,
+                created_at.isoformat(),
+                user_id,
+                username,
+                ", ".join(employees),
+                day.isoformat(),
+                venue,
+                play,
+                text(rng, PROBLEMS),
+                text(rng, CAUSES),
+            ))
+            links += [(ticket_id, name) for name in employees]
+
+        with core.db.writer() as conn:
+            conn.executemany(
+                """
+                INSERT INTO tickets (
+                    id, created_at, user_id, username,
+                    employees, date, venue, play,
+                    problem, cause
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                tickets,
+            )
+            conn.executemany(
+                "INSERT INTO ticket_employees (ticket_id, employee) VALUES (?, ?)",
+                links,
+            )
+
+        next_id += n
+        done += n
+        elapsed = time.perf_counter() - start
+        print(f"\r{done}/{rows} строк, {done / elapsed:.0f} строк/с", end="", file=sys.stderr)
+
+    print(file=sys.stderr)
+    with core.db.writer() as conn:
+        conn.execute("ANALYZE")
+    size = os.path.getsize(path) / 1024 / 1024
+    print(f"Готово: {path}, {rows} строк за {time.perf_counter() - start:.1f} с, {size:.0f} МБ")
+
+
+def load_core(db_path: str):
+    """
+    Импортирует bot_core поверх базы db_path: при импорте он прогоняет
+    миграции, так что схема совпадает с рабочей.
+    """
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("FSM_DB_PATH", os.path.join(tempfile.gettempdir(), "bench_fsm.db"))
+    import bot_core
+    return bot_core
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Синтетическая база обращений")
+    parser.add_argument("path", help="файл базы (дописывается, если уже есть)")
+    parser.add_argument("--rows", type=int, default=100_000, help="сколько обращений добавить")
+    parser.add_argument("--years", type=int, default=5, help="за сколько последних лет даты")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    core = load_core(os.path.abspath(args.path))
+    try:
+        generate(core, core.DB_PATH, args.rows, args.years, args.seed)
+    finally:
+        core.db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
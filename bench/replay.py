@@ -0,0 +1,254 @@
+"""
+Прогон сценариев апдейтов через bot_core.dp.feed_update против локального
+FakeBotAPI — без сети и без настоящего Telegram.
+
+    python -m bench.replay --chats 20 --repeat 3
+    python -m bench.replay --scenarios form,reports --api-latency 30 --json out.json
+
+Каждый чат проходит выбранные сценарии по порядку, чаты идут параллельно.
+Печатает пропускную способность, p50/p95/p99 по хендлерам и по апдейтам
+целиком, число вызовов Bot API на апдейт и пиковый RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable
+
+from bench.fake_api import FakeBotAPI
+from bench.scenarios import SCENARIOS, UpdateFactory
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples, default=0.0) * 1000,
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Пиковый RSS основного процесса, МБ (в Linux ru_maxrss — в килобайтах).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def descendants_peak_rss_mb() -> float:
+    """
+    Наибольший пиковый RSS (VmHWM) среди живых потомков, МБ. Процессы
+    сборки отчётов — дети forkserver, а не наши, поэтому RUSAGE_CHILDREN
+    их не видит; смотрим /proc, пока пул ещё не остановлен.
+    """
+    parents: dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Имя процесса в скобках может содержать пробелы
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    descendants = {os.getpid()}
+    changed = True
+    while changed:
+        changed = False
+        for pid, ppid in parents.items():
+            if ppid in descendants and pid not in descendants:
+                descendants.add(pid)
+                changed = True
+    descendants.discard(os.getpid())
+
+    peak_kb = 0
+    for pid in descendants:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak_kb = max(peak_kb, int(line.split()[1]))
+        except OSError:
+            continue
+    return peak_kb / 1024
+
+
+class HandlerTimer:
+    """
+    Внутренний middleware для dp.message / dp.callback_query:
+    время самого хендлера по его имени.
+    """
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            name = data["handler"].callback.__name__
+            self.samples[name].append(time.perf_counter() - start)
+
+
+def configure_env(workdir: str, keep_limits: bool) -> None:
+    # bot_core читает настройки при импорте — выставляем их заранее
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ["DB_PATH"] = os.path.join(workdir, "tickets.db")
+    os.environ["FSM_DB_PATH"] = os.path.join(workdir, "fsm.db")
+    if not keep_limits:
+        # Меряем сам бот, а не паузы планировщика запросов
+        os.environ.setdefault("API_RATE_PER_SECOND", "1000000")
+        os.environ.setdefault("API_CHAT_RATE_PER_SECOND", "1000000")
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    import bot_core
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    fake = FakeBotAPI(latency=args.api_latency / 1000)
+    base_url = await fake.start()
+    bot, dp = bot_core.bot, bot_core.dp
+    bot.session.api = TelegramAPIServer.from_base(base_url)
+
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.callback_query.middleware(timer)
+
+    names = args.scenarios.split(",")
+    streams: list[list[dict]] = []
+    for n in range(args.chats):
+        factory = UpdateFactory(chat_id=100000 + n)
+        rng = random.Random(args.seed + n)
+        updates: list[dict] = []
+        for _ in range(args.repeat):
+            for name in names:
+                updates += SCENARIOS[name](factory, bot_core, rng)
+        streams.append(updates)
+
+    update_samples: list[float] = []
+
+    async def replay_chat(updates: list[dict]) -> None:
+        for raw in updates:
+            update = Update.model_validate(raw, context={"bot": bot})
+            start = time.perf_counter()
+            await dp.feed_update(bot, update)
+            update_samples.append(time.perf_counter() - start)
+
+    try:
+        await bot.session.create_session()
+        start = time.perf_counter()
+        await asyncio.gather(*(replay_chat(s) for s in streams))
+        elapsed = time.perf_counter() - start
+        children_rss = descendants_peak_rss_mb()
+    finally:
+        await dp.storage.close()
+        await bot.session.close()
+        bot_core.report_renderer.close()
+        bot_core.db.close()
+        await fake.stop()
+
+    updates_total = len(update_samples)
+    return {
+        "scenarios": names,
+        "chats": args.chats,
+        "repeat": args.repeat,
+        "api_latency_ms": args.api_latency,
+        "updates": updates_total,
+        "elapsed_s": elapsed,
+        "updates_per_s": updates_total / elapsed if elapsed else 0.0,
+        "api_calls": dict(fake.calls),
+        "api_calls_per_update": fake.total_calls / updates_total if updates_total else 0.0,
+        "uploaded_mb": fake.uploaded_bytes / 1024 / 1024,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_child_rss_mb": children_rss,
+        "update_latency": summarize(update_samples),
+        "handlers": {name: summarize(s) for name, s in sorted(timer.samples.items())},
+    }
+
+
+def print_report(result: dict[str, Any]) -> None:
+    print(
+        f"Апдейтов: {result['updates']} за {result['elapsed_s']:.2f} с "
+        f"— {result['updates_per_s']:.1f}/с "
+        f"({result['chats']} чатов, сценарии: {', '.join(result['scenarios'])})"
+    )
+    print(
+        f"Вызовов Bot API на апдейт: {result['api_calls_per_update']:.2f}; "
+        f"загружено {result['uploaded_mb']:.1f} МБ"
+    )
+    print(
+        f"Пиковый RSS: {result['peak_rss_mb']:.1f} МБ "
+        f"(процессы отчётов: {result['peak_child_rss_mb']:.1f} МБ)"
+    )
+    print()
+    header = f"{'хендлер':<28}{'n':>7}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = [("апдейт целиком", result["update_latency"])] + list(result["handlers"].items())
+    for name, s in rows:
+        print(
+            f"{name:<28}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+            f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}"
+        )
+    print()
+    print("Вызовы Bot API:", ", ".join(f"{m}={n}" for m, n in sorted(result["api_calls"].items())))
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон апдейтов через bot_core.dp")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"сценарии через запятую ({', '.join(SCENARIOS)})",
+    )
+    parser.add_argument("--chats", type=int, default=20, help="параллельных чатов")
+    parser.add_argument("--repeat", type=int, default=1, help="повторов сценариев в каждом чате")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-limits", action="store_true", help="не снимать лимиты запросов к API")
+    parser.add_argument("--json", help="сохранить результат в JSON-файл")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+        configure_env(workdir, args.keep_limits)
+        result = asyncio.run(run(args))
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
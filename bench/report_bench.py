@@ -0,0 +1,140 @@
+"""
+Замеры отчётов на большой базе (например, из bench.gen_tickets).
+
+    python -m bench.gen_tickets big.db --rows 1000000
+    python -m bench.report_bench big.db
+    python -m bench.report_bench big.db --types date,play,month --repeat 3
+
+Для каждого вида отчёта: число строк, время подсчёта версии (первый
+запрос отчёта) и её проверки при повторном запросе, время выборки строк, время сборки
+xlsx и его размер. Сборка идёт в этом же процессе, как в рендерере.
+"""
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import sys
+import time
+
+from reports import ReportVersions, iter_tickets, render_report_file, report_version
+
+
+def busiest(conn, query: str) -> str | None:
+    row = conn.execute(query).fetchone()
+    return row[0] if row else None
+
+
+def report_filters(conn) -> dict[str, dict[str, str]]:
+    """
+    Фильтры каждого вида отчёта — по самым «тяжёлым» значениям в базе.
+    """
+    latest_date = busiest(conn, "SELECT MAX(date) FROM tickets")
+    return {
+        "all": {},
+        "date": {
+            "filter_date": busiest(
+                conn, "SELECT date FROM tickets GROUP BY date ORDER BY COUNT(*) DESC LIMIT 1"
+            ),
+        },
+        "play": {
+            "filter_play": busiest(
+                conn, "SELECT play FROM tickets GROUP BY play ORDER BY COUNT(*) DESC LIMIT 1"
+            ),
+        },
+        "employee": {
+            "filter_employee": busiest(
+                conn,
+                "SELECT employee FROM ticket_employees GROUP BY employee "
+                "ORDER BY COUNT(*) DESC LIMIT 1",
+            ),
+        },
+        "month": {"year_month": latest_date[:7] if latest_date else "1970-01"},
+    }
+
+
+def measure(db_path: str, conn, filters: dict[str, str]) -> dict[str, float]:
+    start = time.perf_counter()
+    count, _ = report_version(conn, **filters)
+    version_s = time.perf_counter() - start
+
+    # Повторный запрос: выборка не пересчитывается, пока нет новых обращений
+    versions = ReportVersions()
+    versions.get(conn, **filters)
+    start = time.perf_counter()
+    versions.get(conn, **filters)
+    version_hit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fetched = sum(1 for _ in iter_tickets(conn, **filters))
+    fetch_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    path, rendered = render_report_file(db_path, **filters)
+    render_s = time.perf_counter() - start
+    size = 0
+    if path:
+        size = os.path.getsize(path)
+        os.remove(path)
+
+    assert count == fetched == rendered, (count, fetched, rendered)
+    return {
+        "rows": count,
+        "version_ms": version_s * 1000,
+        "version_hit_ms": version_hit_s * 1000,
+        "fetch_s": fetch_s,
+        "render_s": render_s,
+        "rows_per_s": rendered / render_s if render_s else 0.0,
+        "xlsx_mb": size / 1024 / 1024,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Замеры отчётов на большой базе")
+    parser.add_argument("path", help="файл базы обращений")
+    parser.add_argument("--types", default="all,date,play,employee,month", help="виды отчётов через запятую")
+    parser.add_argument("--repeat", type=int, default=1, help="прогонов каждого отчёта (берётся лучший)")
+    parser.add_argument("--json", help="сохранить результат в JSON-файл")
+    args = parser.parse_args(argv)
+
+    db_path = os.path.abspath(args.path)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    total = conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+    all_filters = report_filters(conn)
+
+    types = args.types.split(",")
+    unknown = set(types) - set(all_filters)
+    if unknown:
+        parser.error(f"неизвестные виды отчётов: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in types:
+        runs = [measure(db_path, conn, all_filters[name]) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["render_s"])
+        best["filters"] = all_filters[name]
+        results[name] = best
+    conn.close()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"База: {db_path}, {total} обращений; пиковый RSS {peak_rss:.1f} МБ")
+    header = f"{'отчёт':<10}{'строк':>10}{'версия, мс':>12}{'повтор, мс':>12}{'выборка, с':>12}{'xlsx, с':>10}{'строк/с':>10}{'xlsx, МБ':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<10}{r['rows']:>10}{r['version_ms']:>12.2f}{r['version_hit_ms']:>12.3f}{r['fetch_s']:>12.3f}"
+            f"{r['render_s']:>10.2f}{r['rows_per_s']:>10.0f}{r['xlsx_mb']:>10.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"db": db_path, "tickets": total, "peak_rss_mb": peak_rss, "reports": results},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import itertools
+import random
+from datetime import date, timedelta
+from typing import Callable
+
+# Сценарий: (фабрика апдейтов одного чата, модуль bot_core, генератор) -> апдейты
+Scenario = Callable[["UpdateFactory", object, random.Random], list[dict]]
+
+_update_ids = itertools.count(1)
+
+
+class UpdateFactory:
+    """
+    Апдейты Telegram (в виде JSON) от одного пользователя в личном чате.
+    """
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self._message_ids = itertools.count(1)
+        self._user = {
+            "id": chat_id,
+            "is_bot": False,
+            "first_name": "Bench",
+            "username": f"bench{chat_id}",
+        }
+        self._chat = {"id": chat_id, "type": "private"}
+
+    def message(self, text: str) -> dict:
+        return {
+            "update_id": next(_update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": 0,
+                "chat": self._chat,
+                "from": self._user,
+                "text": text,
+            },
+        }
+
+    def callback(self, data: str) -> dict:
+        update_id = next(_update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(self.chat_id),
+                "from": self._user,
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": 0,
+                    "chat": self._chat,
+                    "text": "keyboard",
+                },
+            },
+        }
+
+
+def _past_day(rng: random.Random) -> date:
+    return date.today() - timedelta(days=rng.randint(0, 60))
+
+
+def form_flow(u: UpdateFactory, core, rng: random.Random) -> list[dict]:
+    """
+    Полная форма обращения от /start до сохранения.
+    """
+    employees = rng.sample(range(len(core.EMPLOYEES)), rng.randint(1, 3))
+    venue = rng.choice(core.VENUES)
+    if venue == "Бронная":
+        prefix, plays = "BRN", core.PLAYS_BRONNAYA
+    else:
+        prefix, plays = "MLN", core.PLAYS_MELNIKOV
+
+    updates = [u.message("/start"), u.message("🚨 Хьюстон, у нас проблемы")]
+    updates += [u.callback(f"EMP:{i}") for i in employees]
+    updates += [
+        u.callback("EMP_DONE"),
+        u.callback(f"CAL:DAY:{_past_day(rng).isoformat()}"),
+        u.callback(f"VENUE:{venue}"),
+        u.callback(f"PLAY:{prefix}:{rng.randrange(len(plays))}"),
+        u.message("Пропал звук в радиомикрофоне во втором акте"),
+        u.message("Села батарейка в передатчике"),
+    ]
+    return updates
+
+
+def employee_toggles(u: UpdateFactory, core, rng: random.Random, toggles: int = 30) -> list[dict]:
+    """
+    Частые клики по клавиатуре сотрудников.
+    """
+    updates = [u.message("🚨 Хьюстон, у нас проблемы")]
+    updates += [
+        u.callback(f"EMP:{rng.randrange(len(core.EMPLOYEES))}") for _ in range(toggles)
+    ]
+    updates.append(u.message("🏠 Главное меню"))
+    return updates
+
+
+def calendar_paging(u: UpdateFactory, core, rng: random.Random, pages: int = 12) -> list[dict]:
+    """
+    Листание календаря на шаге выбора даты: назад на год и обратно.
+    """
+    updates = [
+        u.message("🚨 Хьюстон, у нас проблемы"),
+        u.callback("EMP:0"),
+        u.callback("EMP_DONE"),
+    ]
+    year, month = date.today().year, date.today().month
+    for _ in range(pages):
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+        updates.append(u.callback(f"CAL:PREV:{year}-{month:02d}"))
+    for _ in range(pages):
+        month += 1
+        if month == 13:
+            year, month = year + 1, 1
+        updates.append(u.callback(f"CAL:NEXT:{year}-{month:02d}"))
+    updates.append(u.message("🏠 Главное меню"))
+    return updates
+
+
+def reports(u: UpdateFactory, core, rng: random.Random) -> list[dict]:
+    """
+    Все виды отчётов: из меню и командами.
+    """
+    day = _past_day(rng).isoformat()
+    play = rng.randrange(len(core.ALL_PLAYS))
+    return [
+        u.message("📊 Отчёт"),
+        u.callback("RPT:ALL"),
+        u.callback("RPT:PLAY"),
+        u.callback(f"RPLAY:{play}"),
+        u.callback("RPT:EMP"),
+        u.callback(f"REMP:{rng.randrange(len(core.EMPLOYEES))}"),
+        u.callback("RPT:MONTH"),
+        u.callback(f"MON:SEL:{day[:7]}"),
+        u.callback("RPT:DATE"),
+        u.callback(f"CAL:DAY:{day}"),
+        u.message("/report"),
+        u.message(f"/report_date {day}"),
+        u.message(f"/report_play {core.ALL_PLAYS[play]}"),
+    ]
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "form": form_flow,
+    "toggles": employee_toggles,
+    "calendar": calendar_paging,
+    "reports": reports,
+}
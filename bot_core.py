@@ -1,12 +1,15 @@
 import os
+import asyncio
 import calendar
-import io
-import sqlite3
+import logging
 from datetime import datetime, date
+from functools import lru_cache
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.methods import DeleteMessage, TelegramMethod
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -17,10 +20,36 @@ from aiogram.types import (
     KeyboardButton,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    FSInputFile,
     BufferedInputFile,
 )
 
-from openpyxl import Workbook
+from bot_session import BotSession
+from calendar_cache import CalendarCache
+from database import Database
+from fsm_storage import BufferedStateMiddleware, SQLiteStorage
+from metrics import (
+    ApiMetricsMiddleware,
+    HandlerMetricsMiddleware,
+    database_collector,
+    registry,
+    report_bytes,
+    report_rows,
+)
+from outbox import OutboxSender, enqueue_notification
+from profiler import SlowUpdateProfiler
+from ratelimit import RateLimitMiddleware
+from reports import (
+    ReportCache,
+    ReportFailed,
+    ReportQueueFull,
+    ReportRenderer,
+    ReportVersions,
+    iter_tickets,
+    report_key,
+)
+
+logger = logging.getLogger(__name__)
 
 # =============== НАСТРОЙКИ ===============
 
@@ -28,12 +57,55 @@ API_TOKEN = os.getenv("BOT_TOKEN")
 if not API_TOKEN:
     raise RuntimeError("Не задана переменная окружения BOT_TOKEN")
 
-DB_PATH = "tickets.db"
+DB_PATH = os.getenv("DB_PATH", "tickets.db")
+
+# Отдельный файл для FSM-состояний (недозаполненные формы):
+# частые записи состояний не мешают кэшу и блокировкам основной базы
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "fsm.db")
+
+# Размер пула читающих соединений SQLite (отчёты)
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+
+# Процессы для сборки Excel-отчётов и сколько отчётов может ждать сверх них
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_QUEUE_LIMIT = int(os.getenv("REPORT_QUEUE_LIMIT", "4"))
+
+# Кэш готовых отчётов: число записей и суммарный размер (байт)
+REPORT_CACHE_ENTRIES = int(os.getenv("REPORT_CACHE_ENTRIES", "32"))
+REPORT_CACHE_BYTES = int(os.getenv("REPORT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Таймаут (сек) одного «побочного» вызова Bot API: уборка сообщений, уведомления
+API_CALL_TIMEOUT = float(os.getenv("API_CALL_TIMEOUT", "10"))
 
 # ID общего чата для уведомлений о новых обращениях.
 # В Render нужно добавить переменную окружения GROUP_CHAT_ID (например, -1001234567890).
 GROUP_CHAT_ID = int(os.getenv("GROUP_CHAT_ID", "0"))
 
+# HTTP-клиент Bot API: размер пула соединений, сколько держать простаивающее
+# соединение открытым (сек), TTL кэша DNS (сек), таймауты запроса и соединения
+API_POOL_LIMIT = int(os.getenv("API_POOL_LIMIT", "100"))
+API_KEEPALIVE = float(os.getenv("API_KEEPALIVE", "60"))
+API_DNS_CACHE_TTL = int(os.getenv("API_DNS_CACHE_TTL", "3600"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "60"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "10"))
+
+# Лимиты исходящих запросов к Bot API (на процесс): всего в секунду
+# и сообщений в один личный чат в секунду
+API_RATE_PER_SECOND = float(os.getenv("API_RATE_PER_SECOND", "30"))
+API_CHAT_RATE_PER_SECOND = float(os.getenv("API_CHAT_RATE_PER_SECOND", "1"))
+
+# Доставка уведомлений в общий чат: не чаще N сообщений в минуту,
+# до OUTBOX_BURST подряд; при всплеске обращения склеиваются в дайджест
+OUTBOX_RATE_PER_MINUTE = float(os.getenv("OUTBOX_RATE_PER_MINUTE", "20"))
+OUTBOX_BURST = int(os.getenv("OUTBOX_BURST", "3"))
+
+# Профилирование медленных апдейтов (по умолчанию выключено): сохранять
+# профиль апдейтов дольше PROFILE_SLOW_MS и/или каждого PROFILE_SAMPLE_EVERY-го,
+# в памяти — последние PROFILE_KEEP
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
 # Ограничение доступа к отчётам (если нужно — впиши сюда свой ID)
 ADMIN_IDS: list[int] = []  # пример: [123456789]
 
@@ -122,10 +194,28 @@ class Report(StatesGroup):
 
 # =============== БАЗА ДАННЫХ ===============
 
-def init_db() -> None:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
+# Общие для всех хендлеров постоянные соединения с базой.
+# Функции ниже синхронные: из хендлеров их вызываем только через
+# await db.read(...) / await db.write(...), чтобы не блокировать event loop.
+db = Database(DB_PATH, readers=DB_READERS)
+
+
+def normalize_date(value: str) -> str | None:
+    """
+    Приводит дату к виду YYYY-MM-DD (так она хранится в базе).
+    Понимает также YYYY-M-D и DD.MM.YYYY. None — если это не дата.
+    """
+    value = value.strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _migration_create_tickets(conn) -> None:
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS tickets (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -141,118 +231,244 @@ def init_db() -> None:
         )
         """
     )
-    conn.commit()
-    conn.close()
 
 
-def insert_ticket(ticket: dict) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
+def _migration_report_indexes(conn) -> None:
+    # Все даты — строго YYYY-MM-DD, иначе диапазонные запросы по месяцу
+    # промахнутся мимо записей со старым форматом
+    rows = conn.execute(
         """
-        INSERT INTO tickets (
-            created_at, user_id, username,
-            employees, date, venue, play,
-            problem, cause
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+        SELECT id, date FROM tickets
+        WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+        """
+    ).fetchall()
+    for ticket_id, raw_date in rows:
+        normalized = normalize_date(raw_date or "")
+        if normalized:
+            conn.execute("UPDATE tickets SET date = ? WHERE id = ?", (normalized, ticket_id))
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_date ON tickets(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_play ON tickets(play)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_venue ON tickets(venue)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets(created_at)")
+
+
+def _migration_ticket_employees(conn) -> None:
+    # Связь обращение — сотрудник: отчёт по человеку идёт по индексу,
+    # а не LIKE-поиском по склеенной строке employees
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ticket_employees (
+            ticket_id INTEGER NOT NULL REFERENCES tickets(id) ON DELETE CASCADE,
+            employee TEXT NOT NULL,
+            PRIMARY KEY (ticket_id, employee)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ticket_employees_employee "
+        "ON ticket_employees(employee, ticket_id)"
+    )
+
+    # Переносим уже сохранённые обращения
+    rows = conn.execute("SELECT id, employees FROM tickets").fetchall()
+    conn.executemany(
+        "INSERT OR IGNORE INTO ticket_employees (ticket_id, employee) VALUES (?, ?)",
         (
-            ticket.get("created_at"),
-            ticket.get("user_id"),
-            ticket.get("username"),
-            ", ".join(ticket.get("employees", [])),
-            ticket.get("date"),
-            ticket.get("venue"),
-            ticket.get("play"),
-            ticket.get("problem"),
-            ticket.get("cause"),
+            (ticket_id, name.strip())
+            for ticket_id, employees in rows
+            for name in (employees or "").split(",")
+            if name.strip()
         ),
     )
-    ticket_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return ticket_id
-
-
-def get_tickets(filter_date: str | None = None, filter_play: str | None = None):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    query = """
-        SELECT
-            id,
-            created_at,
-            user_id,
-            username,
-            employees,
-            date,
-            venue,
-            play,
-            problem,
-            cause
-        FROM tickets
-    """
-    conditions: list[str] = []
-    params: list = []
 
-    if filter_date:
-        conditions.append("date = ?")
-        params.append(filter_date)
 
-    if filter_play:
-        conditions.append("play = ?")
-        params.append(filter_play)
+def _migration_report_files(conn) -> None:
+    # file_id отправленных отчётов: неизменившийся отчёт переотправляем
+    # по file_id, без повторной загрузки файла
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS report_files (
+            report_key TEXT PRIMARY KEY,
+            data_version TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            sent_at TEXT
+        )
+        """
+    )
+
+
+def _migration_outbox(conn) -> None:
+    # Исходящие уведомления: пишутся в одной транзакции с обращением
+    # и удаляются только после успешной отправки (см. outbox.OutboxSender)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            created_at TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox(next_attempt_at)"
+    )
+
+
+# Миграции схемы по порядку; новые — только в конец списка
+MIGRATIONS = [
+    _migration_create_tickets,
+    _migration_report_indexes,
+    _migration_ticket_employees,
+    _migration_report_files,
+    _migration_outbox,
+]
+
 
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
+def init_db() -> None:
+    db.migrate(MIGRATIONS)
 
-    query += " ORDER BY id"
 
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+def insert_ticket(ticket: dict) -> int:
+    with db.writer() as conn:
+        cur = conn.execute(
+            """
+            INSERT INTO tickets (
+                created_at, user_id, username,
+                employees, date, venue, play,
+                problem, cause
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                ticket.get("created_at"),
+                ticket.get("user_id"),
+                ticket.get("username"),
+                ", ".join(ticket.get("employees", [])),
+                ticket.get("date"),
+                ticket.get("venue"),
+                ticket.get("play"),
+                ticket.get("problem"),
+                ticket.get("cause"),
+            ),
+        )
+        ticket_id = cur.lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO ticket_employees (ticket_id, employee) VALUES (?, ?)",
+            [(ticket_id, name) for name in ticket.get("employees", [])],
+        )
+        # Уведомление в общий чат — в той же транзакции, что и обращение
+        if GROUP_CHAT_ID != 0:
+            enqueue_notification(conn, GROUP_CHAT_ID, group_notification_text(ticket_id, ticket))
+        return ticket_id
+
+
+def group_notification_text(ticket_id: int, ticket: dict) -> str:
+    username = ticket.get("username") or "без username"
+    employees_str = ", ".join(ticket.get("employees", []))
+    return (
+        "Новое обращение ❗️\n"
+        f"Номер: {ticket_id}\n"
+        f"От: @{username} (id {ticket.get('user_id')})\n\n"
+        f"Сотрудники: {employees_str}\n"
+        f"Дата: {ticket.get('date')}\n"
+        f"Площадка: {ticket.get('venue')}\n"
+        f"Спектакль: {ticket.get('play')}\n"
+        f"Проблема: {ticket.get('problem')}\n"
+        f"Причина: {ticket.get('cause')}\n"
+    )
+
+
+def get_tickets(
+    filter_date: str | None = None,
+    filter_play: str | None = None,
+    filter_employee: str | None = None,
+):
+    with db.reader() as conn:
+        return list(
+            iter_tickets(
+                conn,
+                filter_date=filter_date,
+                filter_play=filter_play,
+                filter_employee=filter_employee,
+            )
+        )
 
 
 def get_tickets_by_month(year_month: str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    query = """
-        SELECT
-            id,
-            created_at,
-            user_id,
-            username,
-            employees,
-            date,
-            venue,
-            play,
-            problem,
-            cause
-        FROM tickets
-        WHERE date LIKE ?
-        ORDER BY id
+    with db.reader() as conn:
+        return list(iter_tickets(conn, year_month=year_month))
+
+
+def get_report_file(filters: dict) -> tuple[int, str, str | None]:
     """
-    like_pattern = f"{year_month}-%"
-    cur.execute(query, (like_pattern,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    Число обращений и версия данных отчёта + file_id уже отправленного
+    в Telegram файла с той же версией (если есть). Выборка пересчитывается,
+    только если с прошлой проверки добавились обращения (ReportVersions).
+    """
+    with db.reader() as conn:
+        count, version = report_versions.get(conn, **filters)
+        row = conn.execute(
+            "SELECT file_id FROM report_files WHERE report_key = ? AND data_version = ?",
+            (report_key(filters), version),
+        ).fetchone()
+    return count, version, row[0] if row else None
+
+
+def save_report_file(filters: dict, version: str, file_id: str) -> None:
+    with db.writer() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO report_files (report_key, data_version, file_id, sent_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (report_key(filters), version, file_id, datetime.utcnow().isoformat()),
+        )
 
 
 # =============== КЛАВИАТУРЫ ===============
 
-def build_employees_keyboard(selected: list[int]) -> InlineKeyboardMarkup:
+# Клавиатуры кэшируются: статичные строятся один раз при старте,
+# параметризованные — запоминаются по параметрам (LRU).
+# Готовые объекты общие для всех запросов, поэтому их нельзя менять на месте.
+
+# Выбор сотрудников хранится битовой маской: бит i — EMPLOYEES[i]
+
+def selected_employees_mask(data: dict) -> int:
+    """
+    Маска выбранных сотрудников из данных формы.
+    Понимает и старый формат — список индексов selected_employees_idx.
+    Биты без сотрудника (например, после сокращения EMPLOYEES) отбрасываются.
+    """
+    mask = data.get("selected_employees_mask")
+    if mask is None:
+        mask = 0
+        for i in data.get("selected_employees_idx", []):
+            if 0 <= i < len(EMPLOYEES):
+                mask |= 1 << i
+    return mask & ((1 << len(EMPLOYEES)) - 1)
+
+
+def employees_from_mask(mask: int) -> list[str]:
+    """
+    Имена выбранных сотрудников в порядке EMPLOYEES (алфавитном).
+    """
+    return [name for i, name in enumerate(EMPLOYEES) if mask & (1 << i)]
+
+
+@lru_cache(maxsize=256)
+def build_employees_keyboard(mask: int) -> InlineKeyboardMarkup:
     """
-    Мультивыбор сотрудников: отмеченные помечаются ✅.
+    Мультивыбор сотрудников: отмеченные в маске помечаются ✅.
     Список EMPLOYEES уже алфавитный.
     """
     buttons: list[list[InlineKeyboardButton]] = []
 
     for i, name in enumerate(EMPLOYEES):
-        prefix = "✅ " if i in selected else ""
+        prefix = "✅ " if mask & (1 << i) else ""
         buttons.append(
             [InlineKeyboardButton(text=prefix + name, callback_data=f"EMP:{i}")]
         )
@@ -264,6 +480,7 @@ def build_employees_keyboard(selected: list[int]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
 def build_venue_keyboard() -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     for v in VENUES:
@@ -273,6 +490,7 @@ def build_venue_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+@lru_cache(maxsize=8)
 def build_plays_keyboard(venue: str) -> InlineKeyboardMarkup:
     if venue == "Бронная":
         plays = PLAYS_BRONNAYA
@@ -290,6 +508,7 @@ def build_plays_keyboard(venue: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+@lru_cache(maxsize=None)
 def build_report_menu_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -297,10 +516,12 @@ def build_report_menu_keyboard() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="Отчёт по дате", callback_data="RPT:DATE")],
             [InlineKeyboardButton(text="Отчёт по спектаклю", callback_data="RPT:PLAY")],
             [InlineKeyboardButton(text="Отчёт по месяцу", callback_data="RPT:MONTH")],
+            [InlineKeyboardButton(text="Отчёт по сотруднику", callback_data="RPT:EMP")],
         ]
     )
 
 
+@lru_cache(maxsize=None)
 def build_report_plays_keyboard() -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     for i, name in enumerate(ALL_PLAYS):
@@ -310,6 +531,17 @@ def build_report_plays_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+@lru_cache(maxsize=None)
+def build_report_employees_keyboard() -> InlineKeyboardMarkup:
+    rows: list[list[InlineKeyboardButton]] = []
+    for i, name in enumerate(EMPLOYEES):
+        rows.append(
+            [InlineKeyboardButton(text=name, callback_data=f"REMP:{i}")]
+        )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@lru_cache(maxsize=None)
 def build_main_keyboard() -> ReplyKeyboardMarkup:
     """
     Главное меню снизу.
@@ -325,6 +557,7 @@ def build_main_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=None)
 def build_context_keyboard() -> ReplyKeyboardMarkup:
     """
     Клавиатура для внутренних шагов:
@@ -352,6 +585,10 @@ def build_calendar(year: int | None = None, month: int | None = None) -> InlineK
     if year is None or month is None:
         year, month = today.year, today.month
 
+    return calendar_cache.get(year, month, today)
+
+
+def _render_calendar(year: int, month: int, today: date) -> InlineKeyboardMarkup:
     kb: list[list[InlineKeyboardButton]] = []
 
     month_name = calendar.month_name[month]
@@ -409,6 +646,11 @@ def build_calendar(year: int | None = None, month: int | None = None) -> InlineK
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 
+# Отрисованные месяцы; после полуночи сбрасываются только затронутые
+calendar_cache = CalendarCache(_render_calendar)
+
+
+@lru_cache(maxsize=32)
 def build_month_keyboard(year: int) -> InlineKeyboardMarkup:
     """
     Клавиатура выбора месяца для отчёта.
@@ -449,44 +691,131 @@ def build_month_keyboard(year: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def prebuild_keyboards() -> None:
+    """
+    Строит статичные клавиатуры заранее, чтобы первый запрос не платил за них.
+    """
+    hot = [
+        build_main_keyboard(),
+        build_context_keyboard(),
+        build_venue_keyboard(),
+        build_report_menu_keyboard(),
+        build_report_plays_keyboard(),
+        build_report_employees_keyboard(),
+    ]
+    hot += [build_plays_keyboard(venue) for venue in VENUES]
+    # JSON этих клавиатур считается один раз и дальше уходит готовой строкой
+    for markup in hot:
+        bot.session.preserialize(markup)
+    build_employees_keyboard(0)
+
+
 # =============== EXCEL ОТЧЁТЫ ===============
 
-def tickets_to_excel(rows) -> bytes:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Обращения"
-
-    headers = [
-        "id",
-        "created_at",
-        "user_id",
-        "username",
-        "employees",
-        "date",
-        "venue",
-        "play",
-        "problem",
-        "cause",
-    ]
-    ws.append(headers)
+# Сборка xlsx идёт в отдельных процессах и не держит GIL основного
+report_renderer = ReportRenderer(
+    DB_PATH,
+    workers=REPORT_WORKERS,
+    max_queue=REPORT_QUEUE_LIMIT,
+)
+
+
+# Готовые отчёты: повторный запрос отдаётся без SQLite-выборки и openpyxl
+report_cache = ReportCache(
+    max_entries=REPORT_CACHE_ENTRIES,
+    max_bytes=REPORT_CACHE_BYTES,
+)
+
 
-    for row in rows:
-        ws.append(row)
+# Версии отчётов: повторный запрос не пересчитывает выборку, пока
+# в базе не появилось новых обращений
+report_versions = ReportVersions()
 
-    bio = io.BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return bio.getvalue()
 
+def read_report_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
 
-async def send_report_excel(message: Message, rows, description: str):
-    if not rows:
+
+async def send_report_excel(message: Message, description: str, **filters):
+    count, version, file_id = await db.read(get_report_file, filters)
+    if not count:
         await message.answer(f"Нет обращений {description}.")
         return
 
-    data = tickets_to_excel(rows)
-    file = BufferedInputFile(data, filename="tickets_report.xlsx")
-    await message.answer_document(file, caption=f"Отчёт {description}")
+    caption = f"Отчёт {description}"
+
+    # Такой же отчёт уже загружался — переотправляем по file_id
+    if file_id:
+        try:
+            await message.answer_document(file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            logger.warning("file_id отчёта больше не действителен, загружаем заново")
+
+    key = report_key(filters)
+    data = report_cache.get(key, version)
+    if data is not None:
+        document = BufferedInputFile(data, filename="tickets_report.xlsx")
+        sent = await message.answer_document(document, caption=caption)
+        await db.write(save_report_file, filters, version, sent.document.file_id)
+        return
+
+    if report_renderer.busy:
+        await message.answer("Сейчас готовится слишком много отчётов, попробуйте через минуту.")
+        return
+
+    wait_msg = await message.answer("⏳ Отчёт готовится…")
+    path = None
+    try:
+        path, count = await report_renderer.render(**filters)
+        if not count:
+            await message.answer(f"Нет обращений {description}.")
+            return
+
+        size = os.path.getsize(path)
+        report_rows.observe(count)
+        report_bytes.observe(size)
+
+        if size <= report_cache.max_entry_bytes:
+            data = await asyncio.to_thread(read_report_file, path)
+            report_cache.put(key, version, data)
+            document = BufferedInputFile(data, filename="tickets_report.xlsx")
+        else:
+            document = FSInputFile(path, filename="tickets_report.xlsx")
+        sent = await message.answer_document(document, caption=caption)
+        await db.write(save_report_file, filters, version, sent.document.file_id)
+    except ReportQueueFull:
+        await message.answer("Сейчас готовится слишком много отчётов, попробуйте через минуту.")
+    except ReportFailed:
+        logger.exception("Процесс сборки отчёта %s завершился аварийно", key)
+        await message.answer("Не удалось собрать отчёт, попробуйте ещё раз.")
+    finally:
+        if path:
+            os.remove(path)
+        try:
+            await wait_msg.delete()
+        except Exception:
+            logger.warning("Не удалось удалить сообщение «Отчёт готовится»", exc_info=True)
+
+
+# =============== ВЫЗОВЫ BOT API ===============
+
+async def api_call(
+    bot_obj: Bot, method: TelegramMethod, description: str, timeout: float = API_CALL_TIMEOUT
+):
+    """
+    Вызов Bot API, сбой которого не должен ломать хендлер: ошибка пишется
+    в лог, результат при ошибке — None. Таймаут — на сам HTTP-запрос:
+    ожидание своей очереди в планировщике (лимиты, 429) его не съедает.
+    """
+    try:
+        return await bot_obj(method, request_timeout=timeout)
+    except TelegramNetworkError as e:
+        logger.warning("Bot API: %s — %s", description, e)
+    except Exception:
+        logger.exception("Bot API: не удалось %s", description)
+    return None
 
 
 # =============== ХЕНДЛЕРЫ ===============
@@ -506,7 +835,7 @@ async def cmd_start(message: Message, state: FSMContext):
 async def new_ticket_message(message: Message, state: FSMContext):
     await state.clear()
     await state.set_state(Form.employees)
-    await state.update_data(selected_employees_idx=[])
+    await state.update_data(selected_employees_mask=0)
 
     # Включаем контекстную клавиатуру (Назад + Главное меню)
     await message.answer(
@@ -514,7 +843,7 @@ async def new_ticket_message(message: Message, state: FSMContext):
         reply_markup=build_context_keyboard(),
     )
 
-    kb = build_employees_keyboard(selected=[])
+    kb = build_employees_keyboard(0)
     await message.answer(
         "1. Выберите сотрудника/ов (можно несколько):",
         reply_markup=kb,
@@ -550,14 +879,14 @@ async def back_message(message: Message, state: FSMContext):
     if current == Form.date.state:
         # Назад к выбору сотрудников
         data = await state.get_data()
-        selected = data.get("selected_employees_idx", [])
+        mask = selected_employees_mask(data)
         await state.set_state(Form.employees)
 
         await message.answer(
             "1. Выберите сотрудника/ов (можно несколько):",
             reply_markup=build_context_keyboard(),
         )
-        kb = build_employees_keyboard(selected)
+        kb = build_employees_keyboard(mask)
         await message.answer(
             "Текущий выбор сотрудников:",
             reply_markup=kb,
@@ -646,16 +975,13 @@ async def back_message(message: Message, state: FSMContext):
 async def employees_callback(call: CallbackQuery, state: FSMContext):
     await call.answer()
     data = await state.get_data()
-    selected: list[int] = data.get("selected_employees_idx", [])
+    mask = selected_employees_mask(data)
 
     if call.data == "EMP_DONE":
-        if not selected:
+        if not mask:
             await call.message.answer("Пожалуйста, выберите хотя бы одного сотрудника.")
             return
 
-        employees = [EMPLOYEES[i] for i in selected]
-        await state.update_data(employees=employees)
-
         await state.set_state(Form.date)
         cal = build_calendar()
         await call.message.answer(
@@ -669,14 +995,16 @@ async def employees_callback(call: CallbackQuery, state: FSMContext):
         return
 
     _, idx_str = call.data.split(":")
-    idx = int(idx_str)
-    if idx in selected:
-        selected.remove(idx)
-    else:
-        selected.append(idx)
+    try:
+        idx = int(idx_str)
+    except ValueError:
+        return
+    if idx < 0 or idx >= len(EMPLOYEES):
+        return
+    mask ^= 1 << idx
 
-    await state.update_data(selected_employees_idx=selected)
-    kb = build_employees_keyboard(selected)
+    await state.update_data(selected_employees_mask=mask)
+    kb = build_employees_keyboard(mask)
     await call.message.edit_reply_markup(reply_markup=kb)
 
 
@@ -800,7 +1128,8 @@ async def cause_entered(message: Message, state: FSMContext):
         "created_at": datetime.utcnow().isoformat(),
         "user_id": message.from_user.id,
         "username": message.from_user.username,
-        "employees": data.get("employees", []),
+        # В форме хранится только маска, имена разворачиваем при сохранении
+        "employees": employees_from_mask(selected_employees_mask(data)),
         "date": data.get("date", ""),
         "venue": data.get("venue", ""),
         "play": data.get("play", ""),
@@ -808,22 +1137,12 @@ async def cause_entered(message: Message, state: FSMContext):
         "cause": cause_text,
     }
 
-    ticket_id = insert_ticket(ticket)
+    ticket_id = await db.write(insert_ticket, ticket)
 
     bot_obj = message.bot
+    chat_id = message.chat.id
     problem_msg_id = data.get("problem_msg_id")
 
-    # Пытаемся очистить "промежуточный" мусор
-    try:
-        await bot_obj.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-    except Exception:
-        pass
-    if problem_msg_id:
-        try:
-            await bot_obj.delete_message(chat_id=message.chat.id, message_id=problem_msg_id)
-        except Exception:
-            pass
-
     await state.clear()
 
     employees_str = ", ".join(ticket["employees"])
@@ -838,29 +1157,33 @@ async def cause_entered(message: Message, state: FSMContext):
         f"Причина: {ticket['cause']}\n"
     )
 
-    # Отправка пользователю + возврат в главное меню
-    kb_main = build_main_keyboard()
-    await message.answer(text, reply_markup=kb_main)
+    # Подтверждение пользователю (+ возврат в главное меню) и уборка
+    # "промежуточного" мусора — одновременно, за один раунд запросов
+    calls = [
+        api_call(
+            bot_obj,
+            message.answer(text, reply_markup=build_main_keyboard()),
+            "отправить подтверждение обращения",
+        ),
+        api_call(
+            bot_obj,
+            DeleteMessage(chat_id=chat_id, message_id=message.message_id),
+            "удалить сообщение с причиной",
+        ),
+    ]
+    if problem_msg_id:
+        calls.append(
+            api_call(
+                bot_obj,
+                DeleteMessage(chat_id=chat_id, message_id=problem_msg_id),
+                "удалить сообщение с проблемой",
+            )
+        )
+    await asyncio.gather(*calls)
 
-    # Отправка в общий чат, если задан GROUP_CHAT_ID
+    # Уведомление в общий чат уже лежит в outbox — отправитель доставит его в фоне
     if GROUP_CHAT_ID != 0:
-        try:
-            username = ticket["username"] or "без username"
-            group_text = (
-                "Новое обращение ❗️\n"
-                f"Номер: {ticket_id}\n"
-                f"От: @{username} (id {ticket['user_id']})\n\n"
-                f"Сотрудники: {employees_str}\n"
-                f"Дата: {ticket['date']}\n"
-                f"Площадка: {ticket['venue']}\n"
-                f"Спектакль: {ticket['play']}\n"
-                f"Проблема: {ticket['problem']}\n"
-                f"Причина: {ticket['cause']}\n"
-            )
-            await bot_obj.send_message(chat_id=GROUP_CHAT_ID, text=group_text)
-        except Exception:
-            # Не ломаем бота, если что-то не так с чатом
-            pass
+        outbox_sender.wake()
 
 
 # --- Команды отчётов ---
@@ -870,8 +1193,7 @@ async def cmd_report_all(message: Message):
         await message.answer("У вас нет прав для просмотра отчёта.")
         return
 
-    rows = get_tickets()
-    await send_report_excel(message, rows, "по всем обращениям")
+    await send_report_excel(message, "по всем обращениям")
 
 
 async def cmd_report_date(message: Message):
@@ -884,9 +1206,12 @@ async def cmd_report_date(message: Message):
         await message.answer("Укажи дату в формате YYYY-MM-DD, например:\n/report_date 2025-12-10")
         return
 
-    filter_date = parts[1].strip()
-    rows = get_tickets(filter_date=filter_date)
-    await send_report_excel(message, rows, f"по дате {filter_date}")
+    filter_date = normalize_date(parts[1])
+    if not filter_date:
+        await message.answer("Не понял дату. Формат: YYYY-MM-DD, например:\n/report_date 2025-12-10")
+        return
+
+    await send_report_excel(message, f"по дате {filter_date}", filter_date=filter_date)
 
 
 async def cmd_report_play(message: Message):
@@ -900,8 +1225,7 @@ async def cmd_report_play(message: Message):
         return
 
     filter_play = parts[1].strip()
-    rows = get_tickets(filter_play=filter_play)
-    await send_report_excel(message, rows, f"по спектаклю «{filter_play}»")
+    await send_report_excel(message, f"по спектаклю «{filter_play}»", filter_play=filter_play)
 
 
 async def cmd_menu(message: Message):
@@ -928,8 +1252,7 @@ async def report_menu_callback(call: CallbackQuery, state: FSMContext):
     _, action = call.data.split(":")
 
     if action == "ALL":
-        rows = get_tickets()
-        await send_report_excel(call.message, rows, "по всем обращениям")
+        await send_report_excel(call.message, "по всем обращениям")
         await call.answer()
         return
 
@@ -975,6 +1298,19 @@ async def report_menu_callback(call: CallbackQuery, state: FSMContext):
         await call.answer()
         return
 
+    if action == "EMP":
+        kb = build_report_employees_keyboard()
+        await call.message.answer(
+            "Выберите сотрудника для отчёта:",
+            reply_markup=build_context_keyboard(),
+        )
+        await call.message.answer(
+            "Сотрудники:",
+            reply_markup=kb,
+        )
+        await call.answer()
+        return
+
 
 async def calendar_report_callback(call: CallbackQuery, state: FSMContext):
     parts = call.data.split(":")
@@ -990,8 +1326,7 @@ async def calendar_report_callback(call: CallbackQuery, state: FSMContext):
 
     if action == "DAY":
         filter_date = parts[2]
-        rows = get_tickets(filter_date=filter_date)
-        await send_report_excel(call.message, rows, f"по дате {filter_date}")
+        await send_report_excel(call.message, f"по дате {filter_date}", filter_date=filter_date)
         await state.clear()
         await call.answer()
         return
@@ -1017,8 +1352,23 @@ async def report_play_callback(call: CallbackQuery):
         return
 
     play_name = ALL_PLAYS[idx]
-    rows = get_tickets(filter_play=play_name)
-    await send_report_excel(call.message, rows, f"по спектаклю «{play_name}»")
+    await send_report_excel(call.message, f"по спектаклю «{play_name}»", filter_play=play_name)
+    await call.answer()
+
+
+async def report_employee_callback(call: CallbackQuery):
+    if ADMIN_IDS and call.from_user.id not in ADMIN_IDS:
+        await call.answer("Нет прав", show_alert=True)
+        return
+
+    _, idx_str = call.data.split(":")
+    idx = int(idx_str)
+    if idx < 0 or idx >= len(EMPLOYEES):
+        await call.answer()
+        return
+
+    employee = EMPLOYEES[idx]
+    await send_report_excel(call.message, f"по сотруднику {employee}", filter_employee=employee)
     await call.answer()
 
 
@@ -1036,8 +1386,7 @@ async def month_report_callback(call: CallbackQuery, state: FSMContext):
 
     if action == "SEL":
         year_month = parts[2]  # YYYY-MM
-        rows = get_tickets_by_month(year_month)
-        await send_report_excel(call.message, rows, f"за {year_month}")
+        await send_report_excel(call.message, f"за {year_month}", year_month=year_month)
         await state.clear()
         await call.answer()
         return
@@ -1058,12 +1407,95 @@ async def month_report_callback(call: CallbackQuery, state: FSMContext):
 
 bot = Bot(
     token=API_TOKEN,
+    session=BotSession(
+        limit=API_POOL_LIMIT,
+        keepalive=API_KEEPALIVE,
+        dns_cache_ttl=API_DNS_CACHE_TTL,
+        timeout=API_TIMEOUT,
+        connect_timeout=API_CONNECT_TIMEOUT,
+    ),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML),
 )
-dp = Dispatcher()
+# Все запросы к Bot API идут через общий планировщик с лимитами Telegram
+rate_limiter = RateLimitMiddleware(
+    rate=API_RATE_PER_SECOND,
+    burst=int(API_RATE_PER_SECOND),
+    chat_rate=API_CHAT_RATE_PER_SECOND,
+    group_rate_per_minute=OUTBOX_RATE_PER_MINUTE,
+    group_burst=OUTBOX_BURST,
+)
+bot.session.middleware(rate_limiter)
+# Время и ошибки самих запросов (после планировщика — без ожидания в очереди)
+bot.session.middleware(ApiMetricsMiddleware())
+
+# Состояния форм в SQLite: переживают рестарт и общие для всех воркеров
+dp = Dispatcher(storage=SQLiteStorage(FSM_DB_PATH))
+
+# Одно чтение и одна запись FSM на апдейт вместо отдельных обращений
+# на каждый get_data/update_data/set_state в хендлере
+dp.update.middleware(BufferedStateMiddleware())
+
+# Время хендлеров для /metrics
+handler_metrics = HandlerMetricsMiddleware()
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
+
+# Профилировщик подключается только по явной настройке: без него
+# на горячем пути нет ни лишнего middleware, ни фонового потока
+update_profiler: SlowUpdateProfiler | None = None
+if PROFILE_SLOW_MS or PROFILE_SAMPLE_EVERY:
+    update_profiler = SlowUpdateProfiler(
+        threshold=PROFILE_SLOW_MS / 1000,
+        sample_every=PROFILE_SAMPLE_EVERY,
+        keep=PROFILE_KEEP,
+    )
+    dp.message.middleware(update_profiler)
+    dp.callback_query.middleware(update_profiler)
+
+# Фоновая доставка уведомлений из outbox (запускается вместе с приложением)
+outbox_sender = OutboxSender(
+    db,
+    bot,
+    rate_per_minute=OUTBOX_RATE_PER_MINUTE,
+    burst=OUTBOX_BURST,
+    # Одно ведро на групповой чат — общее с планировщиком запросов
+    buckets=rate_limiter.chat_bucket,
+)
+
+# Счётчики для /metrics
+database_collector(db)
+registry.attributes(
+    "bot_report_renderer", report_renderer,
+    counters=["rendered", "failed", "rejected", "seconds"], gauges=["pending", "max_time"],
+)
+registry.attributes(
+    "bot_report_cache", report_cache,
+    counters=["hits", "misses", "evictions", "invalidations"], gauges=["size"],
+)
+registry.attributes(
+    "bot_report_versions", report_versions,
+    counters=["hits", "misses"],
+)
+registry.attributes(
+    "bot_calendar_cache", calendar_cache,
+    counters=["hits", "misses", "invalidations"],
+)
+registry.attributes(
+    "bot_outbox", outbox_sender,
+    counters=["sent", "messages", "retries", "failures", "dropped"],
+)
+registry.attributes(
+    "bot_api_scheduler", rate_limiter,
+    counters=["requests", "throttled", "retried"],
+)
+registry.attributes(
+    "bot_api", bot.session,
+    counters=["new_connections", "reused_connections", "dns_cache_hits", "dns_cache_misses"],
+)
 
-# Инициализируем базу при старте
+# Инициализируем базу и статичные клавиатуры при старте
 init_db()
+prebuild_keyboards()
 
 # РЕГИСТРАЦИЯ ХЕНДЛЕРОВ
 
@@ -1092,4 +1524,5 @@ dp.message.register(cause_entered, Form.cause)
 dp.callback_query.register(report_menu_callback, F.data.startswith("RPT"))
 dp.callback_query.register(calendar_report_callback, Report.date, F.data.startswith("CAL"))
 dp.callback_query.register(report_play_callback, F.data.startswith("RPLAY"))
+dp.callback_query.register(report_employee_callback, F.data.startswith("REMP"))
 dp.callback_query.register(month_report_callback, Report.month, F.data.startswith("MON"))
\ No newline at end of file
@@ -0,0 +1,152 @@
+from typing import Any
+
+from aiohttp import ClientSession, ClientTimeout, FormData, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import InputFile
+
+
+class BotSession(AiohttpSession):
+    """
+    HTTP-сессия бота с заранее сериализованными клавиатурами
+    и настраиваемым пулом соединений к api.telegram.org.
+
+    Обычно aiogram на каждый answer/edit_reply_markup заново делает
+    model_dump() клавиатуры и json.dumps(). Для «горячих» клавиатур,
+    зарегистрированных через preserialize(), JSON считается один раз
+    и дальше подставляется в запрос готовой строкой.
+
+    Соединения держатся открытыми keepalive секунд, чтобы запросы
+    хендлеров шли по уже установленному TLS-соединению; счётчики
+    new_connections / reused_connections показывают, как часто это
+    удаётся. Сессию открывает и закрывает жизненный цикл приложения
+    (web_app.on_startup / on_shutdown).
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        keepalive: float = 60.0,
+        dns_cache_ttl: int = 3600,
+        timeout: float = 60.0,
+        connect_timeout: float = 10.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(limit=limit, timeout=timeout, **kwargs)
+        self._connector_init.update(
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        # Общий таймаут запроса + отдельный на установку соединения
+        self._client_timeout = ClientTimeout(
+            total=timeout,
+            connect=connect_timeout,
+            sock_connect=connect_timeout,
+        )
+
+        # Метрики соединений
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+        # id(клавиатуры) -> (клавиатура, JSON или None, пока не посчитан)
+        self._prepared_markups: dict[int, tuple[Any, str | None]] = {}
+
+    def _trace_config(self) -> TraceConfig:
+        trace = TraceConfig()
+
+        async def on_new(session, context, params):
+            self.new_connections += 1
+
+        async def on_reuse(session, context, params):
+            self.reused_connections += 1
+
+        async def on_dns_hit(session, context, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_miss(session, context, params):
+            self.dns_cache_misses += 1
+
+        trace.on_connection_create_end.append(on_new)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        return trace
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={
+                    USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}",
+                },
+                trace_configs=[self._trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: int | None = None,
+    ) -> Any:
+        # aiohttp принимает и ClientTimeout: так работает и таймаут на соединение.
+        # Таймаут отдельного запроса (bot(method, request_timeout=...)) заменяет
+        # только общий, таймаут соединения остаётся прежним
+        client_timeout = self._client_timeout
+        if timeout is not None:
+            client_timeout = ClientTimeout(
+                total=timeout,
+                connect=client_timeout.connect,
+                sock_connect=client_timeout.sock_connect,
+            )
+        return await super().make_request(bot, method, timeout=client_timeout)
+
+    def preserialize(self, markup: Any) -> Any:
+        """
+        Регистрирует неизменяемую (общую, закэшированную) клавиатуру.
+        Сама клавиатура держится в реестре, так что её id не переиспользуется.
+        """
+        self._prepared_markups.setdefault(id(markup), (markup, None))
+        return markup
+
+    def _markup_json(self, bot: Bot, markup: Any) -> str | None:
+        prepared = self._prepared_markups.get(id(markup))
+        if prepared is None or prepared[0] is not markup:
+            return None
+        if prepared[1] is None:
+            # Первый раз сериализуем ровно так же, как это сделал бы aiogram
+            payload = self.prepare_value(markup.model_dump(warnings=False), bot=bot, files={})
+            prepared = self._prepared_markups[id(markup)] = (markup, payload)
+        return prepared[1]
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod[Any]) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        markup_json = self._markup_json(bot, markup) if markup is not None else None
+        if markup_json is None:
+            return super().build_form_data(bot=bot, method=method)
+
+        form = FormData(quote_fields=False)
+        files: dict[str, InputFile] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", markup_json)
+        for key, value in files.items():
+            form.add_field(
+                key,
+                value.read(bot),
+                filename=value.filename or key,
+            )
+        return form
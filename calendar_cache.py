@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from datetime import date
+from typing import Callable
+
+from aiogram.types import InlineKeyboardMarkup
+
+
+class CalendarCache:
+    """
+    Кэш отрисованных месяцев календаря по (год, месяц) с LRU-вытеснением.
+
+    От «сегодня» зависит только месяц, через который проходит граница
+    будущих (неактивных) дней: прошлые месяцы целиком активны, будущие —
+    целиком нет. Поэтому при смене даты сбрасываются лишь месяцы между
+    старым и новым «сегодня» — обычно один текущий, на стыке месяцев
+    ещё и соседний. Листание по прошлым месяцам всегда берётся из кэша.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[int, int, date], InlineKeyboardMarkup],
+        maxsize: int = 64,
+    ):
+        self._render = render
+        self.maxsize = maxsize
+        self._months: OrderedDict[tuple[int, int], InlineKeyboardMarkup] = OrderedDict()
+        self._today: date | None = None
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, year: int, month: int, today: date | None = None) -> InlineKeyboardMarkup:
+        if today is None:
+            today = date.today()
+        if today != self._today:
+            self._rollover(today)
+
+        key = (year, month)
+        markup = self._months.get(key)
+        if markup is not None:
+            self._months.move_to_end(key)
+            self.hits += 1
+            return markup
+
+        self.misses += 1
+        markup = self._render(year, month, today)
+        self._months[key] = markup
+        if len(self._months) > self.maxsize:
+            self._months.popitem(last=False)
+        return markup
+
+    def _rollover(self, today: date) -> None:
+        previous, self._today = self._today, today
+        if previous is None:
+            return
+
+        low, high = sorted([(previous.year, previous.month), (today.year, today.month)])
+        for key in [k for k in self._months if low <= k <= high]:
+            del self._months[key]
+            self.invalidations += 1
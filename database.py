@@ -0,0 +1,194 @@
+import asyncio
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class QueryStats:
+    """
+    Накопленное время выполнения одной функции работы с базой.
+    """
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class Database:
+    """
+    Постоянные соединения с SQLite вместо connect/close на каждый запрос:
+    одно пишущее соединение (под блокировкой) и небольшой пул читающих
+    для отчётов. В режиме WAL читатели не ждут писателя и наоборот.
+
+    Из async-кода база вызывается только через read()/write():
+    запись идёт в одном выделенном потоке (очередь записей),
+    чтение — в пуле потоков по числу читающих соединений,
+    так что event loop никогда не блокируется на SQLite.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        readers: int = 4,
+        cached_statements: int = 128,
+        busy_timeout: float = 5.0,
+        slow_query: float = 0.5,
+    ):
+        self.path = path
+        self.readers_count = max(1, readers)
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        # Порог (сек), после которого запрос пишется в лог как медленный
+        self.slow_query = slow_query
+
+        # Время выполнения по имени функции
+        self.stats: dict[str, QueryStats] = {}
+
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-writer"
+        )
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=self.readers_count, thread_name_prefix="db-reader"
+        )
+
+        self._writer: sqlite3.Connection | None = None
+        self._write_lock = threading.Lock()
+
+        # Свободные читающие соединения; создаются лениво, не больше readers_count
+        self._idle_readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._readers_slots = threading.BoundedSemaphore(self.readers_count)
+        self._all_readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # Иначе SQLite не проверяет REFERENCES и не выполняет ON DELETE CASCADE
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Пишущее соединение. Всё, что сделано внутри блока, —
+        одна транзакция (commit при выходе, rollback при ошибке).
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            with self._writer:
+                yield self._writer
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        Соединение из пула читателей. Если все заняты — ждём свободное.
+        """
+        self._readers_slots.acquire()
+        try:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                conn.execute("PRAGMA query_only=ON")
+                with self._readers_lock:
+                    self._all_readers.append(conn)
+            try:
+                yield conn
+            finally:
+                self._idle_readers.put(conn)
+        finally:
+            self._readers_slots.release()
+
+    def migrate(self, migrations: list[Callable[[sqlite3.Connection], None]]) -> int:
+        """
+        Версионированные миграции схемы. Номер применённой миграции
+        хранится в PRAGMA user_version; каждая миграция — отдельная
+        транзакция, так что старый файл базы обновляется на месте.
+        Возвращает итоговую версию схемы.
+        """
+        for version, migration in enumerate(migrations, start=1):
+            with self.writer() as conn:
+                # IMMEDIATE — чтобы несколько процессов не мигрировали одновременно
+                conn.execute("BEGIN IMMEDIATE")
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if current >= version:
+                    conn.rollback()
+                    continue
+                logger.info("Миграция базы %s: версия %s", self.path, version)
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+
+        with self.reader() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    async def read(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Выполняет fn(*args, **kwargs) в пуле читающих потоков.
+        """
+        return await self._run(self._read_executor, fn, args, kwargs)
+
+    async def write(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Выполняет fn(*args, **kwargs) в единственном пишущем потоке.
+        """
+        return await self._run(self._write_executor, fn, args, kwargs)
+
+    async def _run(self, executor, fn, args, kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(_timed, fn, *args, **kwargs)
+        result, elapsed = await loop.run_in_executor(executor, call)
+
+        name = getattr(fn, "__name__", repr(fn))
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = QueryStats()
+        stats.add(elapsed)
+        if elapsed >= self.slow_query:
+            logger.warning("Медленный запрос к базе: %s — %.3f с", name, elapsed)
+        return result
+
+    def close(self) -> None:
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+        self._idle_readers = queue.LifoQueue()
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
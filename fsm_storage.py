@@ -0,0 +1,310 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Запись FSM: (состояние, данные)
+Record = tuple[str | None, dict[str, Any]]
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в локальном SQLite-файле: недозаполненная форма
+    переживает редеплой и видна всем воркерам.
+
+    Чтение идёт через кэш в памяти процесса. Актуальность кэша проверяется
+    по PRAGMA data_version — она меняется, только когда в файл пишет другое
+    соединение (другой воркер), так что таблицу перечитываем лишь тогда.
+    Запись откладывается: все изменения, сделанные за один проход event
+    loop (set_state + update_data одного хендлера, несколько чатов сразу),
+    уходят в базу одной транзакцией. Вся работа с SQLite — в отдельном
+    потоке, event loop не блокируется.
+    """
+
+    def __init__(self, path: str, key_builder: KeyBuilder | None = None):
+        self.path = path
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._conn: sqlite3.Connection | None = None
+
+        self._cache: dict[str, Record] = {}
+        self._dirty: dict[str, Record] = {}
+        self._version: int | None = None
+        self._flush_task: asyncio.Task | None = None
+
+    # --- Работа с SQLite (только в потоке хранилища) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fsm (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL DEFAULT '{}'
+                ) WITHOUT ROWID
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _read(self, key: str, known_version: int | None, load: bool) -> tuple[int, Record | None]:
+        conn = self._connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if not load and version == known_version:
+            return version, None
+
+        row = conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return version, (None, {})
+        return version, (row[0], json.loads(row[1]))
+
+    def _write(self, records: dict[str, Record]) -> None:
+        conn = self._connect()
+        with conn:
+            for key, (state, data) in records.items():
+                if state is None and not data:
+                    conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO fsm (key, state, data) VALUES (?, ?, ?)",
+                        (key, state, json.dumps(data, ensure_ascii=False)),
+                    )
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # --- Кэш и отложенная запись ---
+
+    async def _get_record(self, key: StorageKey) -> Record:
+        k = self.key_builder.build(key)
+        if k in self._dirty:
+            return self._dirty[k]
+
+        version, record = await self._run(self._read, k, self._version, k not in self._cache)
+        if version != self._version:
+            # В базу писал другой процесс — кэш мог устареть
+            self._cache.clear()
+            self._version = version
+
+        if k in self._dirty:
+            # Пока читали, запись успела измениться в этом процессе
+            return self._dirty[k]
+        if record is None:
+            record = self._cache.get(k)
+            if record is None:
+                version, record = await self._run(self._read, k, self._version, True)
+        self._cache[k] = record
+        return record
+
+    def _set_record(self, key: StorageKey, record: Record) -> None:
+        k = self.key_builder.build(key)
+        self._cache[k] = record
+        self._dirty[k] = record
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        # Даём остальным хендлерам этого прохода loop дописать свои изменения
+        await asyncio.sleep(0)
+        while self._dirty:
+            # Записи остаются в _dirty, пока не сохранены: так close() знает,
+            # что именно не удалось записать
+            records = dict(self._dirty)
+            try:
+                await self._run(self._write, records)
+            except Exception:
+                logger.exception("Не удалось сохранить FSM-состояние")
+                await asyncio.sleep(1)
+                continue
+            for k, record in records.items():
+                # Если запись успели поменять ещё раз, её сохранит следующий проход
+                if self._dirty.get(k) is record:
+                    del self._dirty[k]
+
+    async def get_record(self, key: StorageKey) -> Record:
+        """
+        Состояние и данные за одно обращение к хранилищу.
+        """
+        state, data = await self._get_record(key)
+        return state, data.copy()
+
+    async def set_record(self, key: StorageKey, state: StateType, data: Mapping[str, Any]) -> None:
+        """
+        Состояние и данные одной записью.
+        """
+        if isinstance(state, State):
+            state = state.state
+        self._set_record(key, (state, dict(data)))
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._get_record(key)
+        if isinstance(state, State):
+            state = state.state
+        self._set_record(key, (state, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._get_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise TypeError(msg)
+        state, _ = await self._get_record(key)
+        self._set_record(key, (state, data.copy()))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._get_record(key)
+        return data.copy()
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        Дописывает отложенные записи и закрывает базу. Если за timeout
+        записать не удалось (диск полон, база только для чтения или
+        заблокирована), несохранённые ключи пишутся в лог.
+        """
+        if self._dirty and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush())
+        if self._flush_task is not None:
+            try:
+                await asyncio.wait_for(self._flush_task, timeout)
+            except asyncio.TimeoutError:
+                # wait_for уже отменил запись; поток с зависшим запросом не ждём
+                logger.warning(
+                    "FSM: при остановке не сохранены состояния %s", ", ".join(sorted(self._dirty))
+                )
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                return
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext на время одного апдейта: состояние и данные читаются
+    из хранилища не больше одного раза, хендлер меняет их в памяти,
+    а в хранилище после хендлера уходит одна общая запись (или никакой,
+    если ничего не поменялось).
+
+    Состояние aiogram уже прочитал для фильтров (raw_state) — его
+    переиспользуем, данные подгружаем лениво при первом обращении.
+    """
+
+    def __init__(
+        self,
+        storage: BaseStorage,
+        key: StorageKey,
+        raw_state: str | None = None,
+    ) -> None:
+        super().__init__(storage=storage, key=key)
+        self._state = raw_state
+        self._data: dict[str, Any] | None = None
+        self._state_changed = False
+        self._data_changed = False
+
+    async def _load(self) -> dict[str, Any]:
+        if self._data is None:
+            if isinstance(self.storage, SQLiteStorage):
+                _, self._data = await self.storage.get_record(self.key)
+            else:
+                self._data = await self.storage.get_data(self.key)
+        return self._data
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_changed = True
+
+    async def get_state(self) -> str | None:
+        return self._state
+
+    async def set_data(self, data: Mapping[str, Any]) -> None:
+        self._data = dict(data)
+        self._data_changed = True
+
+    async def get_data(self) -> dict[str, Any]:
+        return (await self._load()).copy()
+
+    async def get_value(self, key: str, default: Any | None = None) -> Any | None:
+        return (await self._load()).get(key, default)
+
+    async def update_data(
+        self,
+        data: Mapping[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        current = await self._load()
+        if data:
+            current.update(data)
+        current.update(kwargs)
+        self._data_changed = True
+        return current.copy()
+
+    async def clear(self) -> None:
+        await self.set_state(None)
+        await self.set_data({})
+
+    async def flush(self) -> None:
+        if self._data_changed and isinstance(self.storage, SQLiteStorage):
+            await self.storage.set_record(self.key, self._state, self._data)
+        else:
+            if self._state_changed:
+                await self.storage.set_state(self.key, self._state)
+            if self._data_changed:
+                await self.storage.set_data(self.key, self._data)
+        self._state_changed = self._data_changed = False
+
+
+class BufferedStateMiddleware(BaseMiddleware):
+    """
+    Подменяет FSMContext апдейта на BufferedFSMContext и сбрасывает
+    накопленные изменения одной записью после хендлера.
+    Регистрируется как внутренний middleware dp.update.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        context = data.get("state")
+        if context is None:
+            return await handler(event, data)
+
+        buffered = BufferedFSMContext(
+            storage=context.storage,
+            key=context.key,
+            raw_state=data.get("raw_state"),
+        )
+        data["state"] = buffered
+        try:
+            return await handler(event, data)
+        finally:
+            await buffered.flush()
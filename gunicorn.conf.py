@@ -0,0 +1,4 @@
+# Настройки gunicorn: подхватываются из рабочего каталога автоматически,
+# так что прежняя команда запуска `gunicorn web_app:app` продолжает работать.
+# web_app.app — aiohttp-приложение, синхронный WSGI-воркер его не запустит.
+worker_class = "aiohttp.GunicornWebWorker"
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from metrics import loop_lag, registry
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Следит за отзывчивостью event loop.
+
+    Задача в самом loop каждые interval секунд засыпает и меряет, насколько
+    позже обещанного проснулась, — это и есть задержка (lag): столько
+    ждал бы любой готовый к работе апдейт. Все замеры идут в гистограмму
+    и в окно последних window значений для перцентилей.
+
+    Сторожевой поток замечает, что задача давно не отмечалась (loop чем-то
+    занят дольше threshold секунд), и пишет в лог стек потока loop прямо
+    во время блокировки — видно, какой синхронный вызов его держит.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, window: int = 1000):
+        self.interval = interval
+        self.threshold = threshold
+        self._window: deque[float] = deque(maxlen=window)
+
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._loop_thread: int | None = None
+        # Когда задача замера последний раз получила управление (monotonic)
+        self._heartbeat = 0.0
+
+        # Метрики
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._measure(), name="loop-monitor")
+        if self.threshold:
+            self._thread = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def percentile(self, q: float) -> float:
+        """
+        q-й перцентиль задержки (сек) по окну последних замеров.
+        """
+        if not self._window:
+            return 0.0
+        ordered = sorted(self._window)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    async def _measure(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+
+            lag = max(0.0, now - start - self.interval)
+            loop_lag.observe(lag)
+            self._window.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if self.threshold and lag >= self.threshold:
+                logger.warning("Event loop был заблокирован %.0f мс", lag * 1000)
+
+    def _watchdog(self) -> None:
+        reported = 0.0
+        check = min(self.interval, self.threshold / 2)
+        while not self._stop.wait(check):
+            heartbeat = self._heartbeat
+            if heartbeat == reported:
+                # Эта блокировка уже в логе
+                continue
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+            logger.warning(
+                "Event loop не отвечает уже %.0f мс, стек потока loop:\n%s",
+                stalled * 1000,
+                "".join(traceback.format_stack(frame)),
+            )
+
+
+def loop_monitor_collector(monitor: LoopMonitor) -> None:
+    """
+    Перцентили задержки event loop по окну последних замеров для /metrics.
+    """
+
+    def collect():
+        yield (
+            "bot_event_loop_lag_recent_seconds", "gauge",
+            "Задержка event loop по последним замерам",
+            [({"quantile": str(q / 100)}, monitor.percentile(q)) for q in (50, 90, 99)],
+        )
+        yield "bot_event_loop_lag_max_seconds", "gauge", "Наибольшая задержка event loop", [({}, monitor.max_lag)]
+        yield "bot_event_loop_stalls_total", "counter", "Блокировки event loop дольше порога", [({}, monitor.stalls)]
+
+    registry.collector(collect)
@@ -0,0 +1,280 @@
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+# Метрики в текстовом формате Prometheus, без сторонних библиотек.
+# Всё обновляется из потока event loop, поэтому блокировки не нужны:
+# на горячем пути — только инкременты уже созданных счётчиков.
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROWS_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BYTES_BUCKETS = (16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20, 64 << 20)
+
+# (метка: значение) -> значение сэмпла
+Samples = Iterable[tuple[dict[str, str], float]]
+# Собранная метрика: (имя, тип, описание, сэмплы)
+Metric = tuple[str, str, str, Samples]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    """
+    Гистограммы по значению одной метки (или одна — без метки).
+    """
+
+    def __init__(self, name: str, help: str, label: str | None = None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._children: dict[str, Histogram] = {}
+
+    def observe(self, value: float, label: str = "") -> None:
+        child = self._children.get(label)
+        if child is None:
+            child = self._children[label] = Histogram(self.buckets)
+        child.observe(value)
+
+    def render(self, out: list[str]) -> None:
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        for label, h in sorted(self._children.items()):
+            base = {self.label: label} if self.label else {}
+            cumulative = 0
+            for bound, count in zip(self.buckets, h.counts):
+                cumulative += count
+                out.append(f"{self.name}_bucket{_labels(base, le=_number(bound))} {cumulative}")
+            out.append(f"{self.name}_bucket{_labels(base, le='+Inf')} {h.count}")
+            out.append(f"{self.name}_sum{_labels(base)} {_number(h.sum)}")
+            out.append(f"{self.name}_count{_labels(base)} {h.count}")
+
+
+class CounterFamily:
+    """
+    Счётчики по значению одной метки (или один — без метки).
+    """
+
+    def __init__(self, name: str, help: str, label: str | None = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: dict[str, int] = {}
+
+    def inc(self, label: str = "", amount: int = 1) -> None:
+        self._values[label] = self._values.get(label, 0) + amount
+
+    def render(self, out: list[str]) -> None:
+        _render_metric(
+            out,
+            (
+                self.name,
+                "counter",
+                self.help,
+                [({self.label: k} if self.label else {}, v) for k, v in sorted(self._values.items())],
+            ),
+        )
+
+
+class Registry:
+    """
+    Набор метрик для /metrics: семейства, которые обновляются по ходу
+    работы, и коллекторы — функции, которые в момент запроса читают
+    уже накопленные счётчики объектов (база, очереди, кэши).
+    """
+
+    def __init__(self):
+        self._families: list[HistogramFamily | CounterFamily] = []
+        self._collectors: list[Callable[[], Iterable[Metric]]] = []
+
+    def histogram(self, name: str, help: str, label: str | None = None, buckets=LATENCY_BUCKETS) -> HistogramFamily:
+        family = HistogramFamily(name, help, label, buckets)
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, help: str, label: str | None = None) -> CounterFamily:
+        family = CounterFamily(name, help, label)
+        self._families.append(family)
+        return family
+
+    def collector(self, fn: Callable[[], Iterable[Metric]]) -> Callable[[], Iterable[Metric]]:
+        self._collectors.append(fn)
+        return fn
+
+    def attributes(self, prefix: str, obj: Any, counters: Iterable[str] = (), gauges: Iterable[str] = ()) -> None:
+        """
+        Коллектор числовых атрибутов объекта: prefix_<атрибут>[_total].
+        """
+        counters, gauges = list(counters), list(gauges)
+
+        def collect() -> Iterable[Metric]:
+            for attr in counters:
+                yield f"{prefix}_{attr}_total", "counter", f"{prefix}: {attr}", [({}, getattr(obj, attr))]
+            for attr in gauges:
+                yield f"{prefix}_{attr}", "gauge", f"{prefix}: {attr}", [({}, getattr(obj, attr))]
+
+        self.collector(collect)
+
+    def render(self) -> str:
+        out: list[str] = []
+        for family in self._families:
+            family.render(out)
+        for collect in self._collectors:
+            for metric in collect():
+                _render_metric(out, metric)
+        out.append("")
+        return "\n".join(out)
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(base: dict[str, str], **extra: str) -> str:
+    labels = {**base, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _render_metric(out: list[str], metric: Metric) -> None:
+    name, kind, help, samples = metric
+    out.append(f"# HELP {name} {help}")
+    out.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        out.append(f"{name}{_labels(labels)} {_number(value)}")
+
+
+# =============== Метрики бота ===============
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Время работы хендлера", "handler"
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Хендлеры, завершившиеся исключением", "handler"
+)
+api_latency = registry.histogram(
+    "bot_api_request_duration_seconds", "Время запроса к Bot API", "method"
+)
+api_errors = registry.counter(
+    "bot_api_errors_total", "Запросы к Bot API, завершившиеся ошибкой", "method"
+)
+api_flood_waits = registry.counter(
+    "bot_api_flood_waits_total", "Ответы 429 (retry_after) от Bot API", "method"
+)
+report_rows = registry.histogram(
+    "bot_report_rows", "Строк в собранном отчёте", buckets=ROWS_BUCKETS
+)
+report_bytes = registry.histogram(
+    "bot_report_xlsx_bytes", "Размер собранного xlsx", buckets=BYTES_BUCKETS
+)
+
+loop_lag = registry.histogram(
+    "bot_event_loop_lag_seconds", "Задержка event loop (насколько позже проснулся таймер)",
+    buckets=LAG_BUCKETS,
+)
+
+
+def database_collector(db) -> Callable[[], Iterable[Metric]]:
+    """
+    Время запросов к SQLite по функциям (Database.stats).
+    """
+
+    def collect() -> Iterable[Metric]:
+        stats = sorted(db.stats.items())
+        yield (
+            "bot_db_calls_total", "counter", "Вызовы функций работы с базой",
+            [({"function": name}, s.count) for name, s in stats],
+        )
+        yield (
+            "bot_db_seconds_total", "counter", "Суммарное время функций работы с базой",
+            [({"function": name}, s.total) for name, s in stats],
+        )
+        yield (
+            "bot_db_seconds_max", "gauge", "Самый долгий вызов функции работы с базой",
+            [({"function": name}, s.max) for name, s in stats],
+        )
+
+    return registry.collector(collect)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время хендлеров по имени — внутренний middleware для dp.message
+    и dp.callback_query (там уже известен выбранный хендлер).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - start, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Запросы к Bot API по методам: время, ошибки, 429. Регистрируется
+    после RateLimitMiddleware, чтобы мерить сам запрос, а не очередь.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            api_flood_waits.inc(name)
+            api_errors.inc(name)
+            raise
+        except Exception:
+            api_errors.inc(name)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - start, name)
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from database import Database
+from ratelimit import TokenBucket, bulk_requests, self_throttled
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+
+
+# --- Работа с таблицей outbox (синхронно, на соединении из Database) ---
+
+def enqueue_notification(conn, chat_id: int, text: str) -> None:
+    """
+    Кладёт уведомление в outbox. Вызывается внутри транзакции,
+    которая сохраняет само обращение, — вместе они либо есть, либо нет.
+    """
+    conn.execute(
+        "INSERT INTO outbox (chat_id, text, created_at) VALUES (?, ?, ?)",
+        (chat_id, text, datetime.utcnow().isoformat()),
+    )
+
+
+def next_notification(conn) -> tuple[int, float] | None:
+    """
+    (чат, время попытки) ближайшего уведомления или None, если outbox пуст.
+    """
+    return conn.execute(
+        "SELECT chat_id, next_attempt_at FROM outbox ORDER BY next_attempt_at, id LIMIT 1"
+    ).fetchone()
+
+
+def digest_text(texts: list[str]) -> str:
+    """
+    Одно сообщение вместо нескольких уведомлений подряд.
+    """
+    if len(texts) == 1:
+        return texts[0][:MESSAGE_LIMIT]
+    text = f"Новых обращений: {len(texts)}\n\n" + "\n\n".join(texts)
+    return text[:MESSAGE_LIMIT]
+
+
+def claim_notifications(
+    conn,
+    chat_id: int,
+    now: float,
+    limit: int,
+    lease: float,
+) -> list[tuple[int, str, int]]:
+    """
+    Забирает готовые к отправке уведомления чата — столько, сколько
+    влезает в одно сообщение (но не больше limit), — и откладывает их
+    на lease секунд. Если отправитель упадёт, не удалив их, их подберёт
+    следующая попытка (в том числе в другом процессе).
+    Возвращает [(id, текст, число попыток)].
+    """
+    # IMMEDIATE — чтобы два процесса не забрали одни и те же записи
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(
+        """
+        SELECT id, text, attempts FROM outbox
+        WHERE chat_id = ? AND next_attempt_at <= ?
+        ORDER BY id
+        LIMIT ?
+        """,
+        (chat_id, now, limit),
+    ).fetchall()
+
+    picked: list[tuple[int, str, int]] = []
+    for row in rows:
+        if picked and len(digest_text([r[1] for r in picked] + [row[1]])) >= MESSAGE_LIMIT:
+            break
+        picked.append(row)
+
+    conn.executemany(
+        "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+        [(now + lease, row[0]) for row in picked],
+    )
+    return picked
+
+
+def delete_notifications(conn, ids: list[int]) -> None:
+    conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+
+def reschedule_notifications(conn, ids: list[int], next_attempt_at: float, attempts: int) -> None:
+    conn.executemany(
+        "UPDATE outbox SET next_attempt_at = ?, attempts = ? WHERE id = ?",
+        [(next_attempt_at, attempts, i) for i in ids],
+    )
+
+
+# --- Фоновый отправитель ---
+
+class OutboxSender:
+    """
+    Фоновая доставка уведомлений из outbox.
+
+    - частота отправки в каждый чат ограничена TokenBucket
+      (у групп Telegram лимит ~20 сообщений в минуту); если передан
+      buckets (RateLimitMiddleware.chat_bucket), ведро чата общее
+      с планировщиком запросов, иначе — своё;
+    - на 429 ждём ровно retry_after и повторяем, попытка не засчитывается;
+    - прочие ошибки — повтор с экспоненциальной задержкой,
+      после max_attempts уведомление выбрасывается с записью в лог;
+    - если за время ожидания токена накопилось несколько уведомлений,
+      они уходят одним сообщением-дайджестом.
+
+    Запись удаляется из outbox только после успешной отправки,
+    так что уведомления переживают сетевые сбои и рестарты.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        bot: Bot,
+        rate_per_minute: float = 20,
+        burst: int = 3,
+        batch: int = 10,
+        max_attempts: int = 10,
+        backoff: float = 5.0,
+        max_backoff: float = 600.0,
+        lease: float = 60.0,
+        poll_interval: float = 5.0,
+        send_timeout: float = 30.0,
+        buckets: Callable[[int], TokenBucket] | None = None,
+    ):
+        self.db = db
+        self.bot = bot
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.send_timeout = send_timeout
+
+        self._buckets: dict[int, TokenBucket] = {}
+        self._shared_buckets = buckets
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+        # Метрики
+        self.sent = 0
+        self.messages = 0
+        self.retries = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="outbox-sender")
+
+    async def stop(self, timeout: float = 30) -> None:
+        """
+        Останавливает отправителя, дав закончить текущую отправку.
+        Неотправленное остаётся в outbox до следующего запуска.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            # wait_for уже отменил задачу; захваченные записи вернутся по истечении lease
+            logger.warning("Outbox: не дождались отправки при остановке")
+        self._task = None
+
+    def wake(self) -> None:
+        """
+        В outbox появилась запись — не ждать следующего опроса.
+        """
+        self._wakeup.set()
+
+    # --- Вызовы базы (выполняются в потоках Database) ---
+
+    def _outbox_next(self) -> tuple[int, float] | None:
+        with self.db.reader() as conn:
+            return next_notification(conn)
+
+    def _outbox_claim(self, chat_id: int, now: float) -> list[tuple[int, str, int]]:
+        with self.db.writer() as conn:
+            return claim_notifications(conn, chat_id, now, self.batch, self.lease)
+
+    def _outbox_delete(self, ids: list[int]) -> None:
+        with self.db.writer() as conn:
+            delete_notifications(conn, ids)
+
+    def _outbox_reschedule(self, ids: list[int], next_attempt_at: float, attempts: int) -> None:
+        with self.db.writer() as conn:
+            reschedule_notifications(conn, ids, next_attempt_at, attempts)
+
+    # --- Цикл отправки ---
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        if self._shared_buckets is not None:
+            return self._shared_buckets(chat_id)
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await self._step()
+            except Exception:
+                logger.exception("Outbox: ошибка отправителя")
+                await self._wait(self.poll_interval)
+
+    async def _step(self) -> None:
+        head = await self.db.read(self._outbox_next)
+        if head is None:
+            await self._wait(self.poll_interval)
+            return
+
+        chat_id, next_attempt_at = head
+        delay = next_attempt_at - time.time()
+        if delay > 0:
+            await self._wait(min(delay, self.poll_interval))
+            return
+
+        # Пока ждём токен, успевают накопиться новые обращения — уйдут дайджестом
+        await self._bucket(chat_id).acquire()
+        rows = await self.db.write(self._outbox_claim, chat_id, time.time())
+        if rows:
+            await self._send(chat_id, rows)
+
+    async def _send(self, chat_id: int, rows: list[tuple[int, str, int]]) -> None:
+        ids = [row[0] for row in rows]
+        text = digest_text([row[1] for row in rows])
+        try:
+            # Тексты уведомлений — обычный текст, без HTML-разметки.
+            # Фоновая отправка уступает ответам пользователям; токен чата уже
+            # взят в _step, а 429 обрабатывается здесь же — без повторов в
+            # планировщике. Таймаут — на сам запрос, не на ожидание очереди.
+            with bulk_requests(), self_throttled():
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode=None,
+                    request_timeout=self.send_timeout,
+                )
+        except TelegramRetryAfter as e:
+            self.retries += 1
+            self._bucket(chat_id).pause(e.retry_after)
+            attempts = max(row[2] for row in rows)
+            await self.db.write(
+                self._outbox_reschedule, ids, time.time() + e.retry_after, attempts
+            )
+            logger.warning("Outbox: флуд-лимит чата %s, повтор через %s с", chat_id, e.retry_after)
+        except Exception:
+            self.failures += 1
+            attempts = max(row[2] for row in rows) + 1
+            if attempts >= self.max_attempts:
+                self.dropped += len(ids)
+                await self.db.write(self._outbox_delete, ids)
+                logger.exception(
+                    "Outbox: уведомления %s в чат %s не доставлены после %s попыток",
+                    ids, chat_id, attempts,
+                )
+                return
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            await self.db.write(self._outbox_reschedule, ids, time.time() + delay, attempts)
+            logger.warning(
+                "Outbox: не удалось отправить в чат %s (попытка %s), повтор через %.0f с",
+                chat_id, attempts, delay, exc_info=True,
+            )
+        else:
+            self.sent += len(ids)
+            self.messages += 1
+            await self.db.write(self._outbox_delete, ids)
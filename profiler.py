@@ -0,0 +1,221 @@
+import asyncio
+import gc
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+# Стек в «свёрнутом» виде: кадры от корня к вершине
+Stack = tuple[str, ...]
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def thread_stack(frame, max_depth: int) -> Stack:
+    """
+    Стек потока, начиная с кадра frame (вершины), — от корня к вершине.
+    """
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def await_stack(task: asyncio.Task, max_depth: int) -> Stack:
+    """
+    Цепочка await приостановленной задачи — от корутины задачи до того,
+    чего она ждёт (future пула потоков, сокет и т.п.).
+    """
+    names = []
+    coro: Any = task.get_coro()
+    while coro is not None and len(names) < max_depth:
+        if type(coro).__name__ == "coroutine_wrapper":
+            # await obj, где obj.__await__() возвращает корутину (методы
+            # aiogram): у обёртки нет атрибутов, корутину достаём через gc
+            coro = next(iter(gc.get_referents(coro)), None)
+            continue
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            names.append(f"<{type(coro).__name__}>")
+            break
+        names.append(_frame_name(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return tuple(names)
+
+
+class _Active:
+    __slots__ = ("task", "samples")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.samples: Counter[tuple[str, Stack]] = Counter()
+
+
+class UpdateProfile:
+    """
+    Профиль одного апдейта: сэмплы стеков «cpu» (код выполнялся в
+    event loop) и «wait» (задача ждала — базу, сеть, процесс отчётов).
+    """
+
+    __slots__ = ("id", "handler", "callback_data", "update_id", "started_at", "duration", "samples")
+
+    def __init__(self, id, handler, callback_data, update_id, started_at, duration, samples):
+        self.id = id
+        self.handler = handler
+        self.callback_data = callback_data
+        self.update_id = update_id
+        self.started_at = started_at
+        self.duration = duration
+        self.samples = samples
+
+    def summary(self) -> dict[str, Any]:
+        cpu = sum(n for (kind, _), n in self.samples.items() if kind == "cpu")
+        return {
+            "id": self.id,
+            "handler": self.handler,
+            "callback_data": self.callback_data,
+            "update_id": self.update_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": sum(self.samples.values()),
+            "cpu_samples": cpu,
+        }
+
+    def collapsed(self) -> str:
+        """
+        Стеки в формате «кадр;кадр;... число» — подходит для flamegraph.pl
+        и speedscope. Первый кадр — вид сэмпла (cpu / wait).
+        """
+        return "".join(
+            ";".join((kind,) + stack) + f" {count}\n"
+            for (kind, stack), count in self.samples.most_common()
+        )
+
+
+class SlowUpdateProfiler(BaseMiddleware):
+    """
+    Сэмплирующий профилировщик апдейтов (внутренний middleware для
+    dp.message / dp.callback_query). Включается только явно: если
+    middleware не зарегистрирован, он ничего не стоит.
+
+    Фоновый поток раз в interval секунд смотрит, что делает поток event
+    loop, и приписывает сэмпл апдейту, чья задача сейчас выполняется
+    («cpu»), а остальным апдейтам в работе — место, где они ждут («wait»).
+    После хендлера профиль сохраняется, если апдейт шёл дольше threshold
+    секунд или попал в выборку «каждый sample_every-й»; в памяти — последние keep.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 1.0,
+        sample_every: int = 0,
+        keep: int = 20,
+        interval: float = 0.005,
+        max_depth: int = 64,
+    ):
+        self.threshold = threshold
+        self.sample_every = sample_every
+        self.interval = interval
+        self.max_depth = max_depth
+        self.profiles: deque[UpdateProfile] = deque(maxlen=keep)
+
+        self._active: dict[asyncio.Task, _Active] = {}
+        self._seen = 0
+        self._ids = itertools.count(1)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        if task is None:
+            return await handler(event, data)
+        self._ensure_sampler()
+
+        self._seen += 1
+        sampled = bool(self.sample_every) and self._seen % self.sample_every == 0
+        active = self._active[task] = _Active(task)
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            duration = time.perf_counter() - start
+            del self._active[task]
+            if sampled or (self.threshold and duration >= self.threshold):
+                update = data.get("event_update")
+                self.profiles.append(
+                    UpdateProfile(
+                        id=next(self._ids),
+                        handler=data["handler"].callback.__name__,
+                        callback_data=_callback_data(event),
+                        update_id=update.update_id if update else None,
+                        started_at=started_at,
+                        duration=duration,
+                        samples=Counter(active.samples),
+                    )
+                )
+
+    def get(self, profile_id: int) -> UpdateProfile | None:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _ensure_sampler(self) -> None:
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample_loop, name="update-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self._active:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            running = asyncio.current_task(self._loop)
+            for task, active in list(self._active.items()):
+                try:
+                    if task is running and frame is not None:
+                        key = ("cpu", thread_stack(frame, self.max_depth))
+                    else:
+                        key = ("wait", await_stack(task, self.max_depth))
+                except Exception:
+                    # Задача успела смениться, пока мы её разглядывали
+                    continue
+                active.samples[key] += 1
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+def _callback_data(event: TelegramObject) -> str | None:
+    if isinstance(event, CallbackQuery):
+        return event.data
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        # Для команд — сама команда (без аргументов: там могут быть данные)
+        return event.text.split(maxsplit=1)[0]
+    return None
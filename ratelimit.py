@@ -0,0 +1,290 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, SendDocument, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: меньше — важнее
+INTERACTIVE = 0
+BULK = 1
+
+# Приоритет исходящих запросов в текущем контексте (задаче)
+request_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+# Вызывающий сам взял токен чата и сам обрабатывает 429 (см. self_throttled())
+caller_throttled: ContextVar[bool] = ContextVar("caller_throttled", default=False)
+
+
+@contextmanager
+def bulk_requests() -> Iterator[None]:
+    """
+    Запросы внутри блока — фоновые: уступают ответам пользователям.
+    """
+    token = request_priority.set(BULK)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+@contextmanager
+def self_throttled() -> Iterator[None]:
+    """
+    Запросы внутри блока уже прошли лимит чата (вызывающий взял токен из
+    RateLimitMiddleware.chat_bucket) и сами обрабатывают 429: планировщик
+    применяет к ним только общий лимит и не повторяет их.
+    """
+    token = caller_throttled.set(True)
+    try:
+        yield
+    finally:
+        caller_throttled.reset(token)
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты «ведро с токенами»: в среднем rate событий
+    в секунду, но не больше capacity подряд после простоя.
+
+    Ожидающие получают токены по приоритету, при равном — по очереди.
+    pause() — принудительная пауза (например, retry_after из ответа 429):
+    до её конца токены не выдаются, а ведро после неё начинает с нуля.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+        # Очередь ожидающих: (приоритет, номер, future)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+
+    def _refill(self, now: float) -> None:
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def delay(self) -> float:
+        """
+        Сколько секунд ждать до следующего токена (0 — можно сейчас).
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now + max(0.0, 1 - self._tokens) / self.rate
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    @property
+    def idle(self) -> bool:
+        """
+        Ведро полное и никто не ждёт — его можно выбросить.
+        """
+        return not self._waiters and self.delay() == 0 and self._tokens >= self.capacity
+
+    def try_acquire(self) -> bool:
+        if self.delay() > 0:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        """
+        Ждёт токен и забирает его.
+        """
+        if not self._waiters and self.try_acquire():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        # Раздаёт токены ожидающим по мере пополнения ведра
+        while self._waiters:
+            delay = self.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Ожидавший уже отменён — токен достанется следующему
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API (request-middleware сессии).
+
+    - общий лимит на все запросы (у Telegram ~30 в секунду на бота);
+    - лимит сообщений в каждый чат: личные ~1 в секунду с небольшим
+      запасом подряд, группы ~20 в минуту;
+    - в очереди за токеном ответы пользователям идут раньше фоновых
+      запросов (отчёты, уведомления — см. bulk_requests());
+    - на 429 на паузу retry_after встаёт чат запроса (в том числе для
+      правок и удалений), а общий лимит — только если чата у запроса нет;
+      запрос повторяется сам, вместо ошибки в хендлере.
+
+    Таймаут, заданный вызывающим через bot(method, request_timeout=...),
+    действует на сам HTTP-запрос, а не на ожидание в очереди.
+
+    Лимиты — на процесс: при нескольких воркерах gunicorn общий
+    лимит стоит делить между ними.
+    """
+
+    def __init__(
+        self,
+        rate: float = 30,
+        burst: int = 30,
+        chat_rate: float = 1,
+        chat_burst: int = 5,
+        group_rate_per_minute: float = 20,
+        group_burst: int = 3,
+        max_retries: int = 3,
+        max_retry_after: float = 60,
+        max_chats: int = 10000,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_minute / 60
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        # Дольше этого не ждём — отдаём ошибку вызывающему
+        self.max_retry_after = max_retry_after
+        self.max_chats = max_chats
+        self._chats: dict[int | str, TokenBucket] = {}
+        # Пауза чата после 429 (monotonic) — для запросов без лимита
+        # сообщений: правки, удаления. Токенов они не тратят
+        self._chat_pauses: dict[int | str, float] = {}
+
+        # Метрики
+        self.requests = 0
+        self.throttled = 0
+        self.retried = 0
+
+    def chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                # Забываем чаты, которые давно ничего не получали
+                for key in [k for k, b in self._chats.items() if b.idle]:
+                    del self._chats[key]
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def pause_chat(self, chat_id: int | str, seconds: float) -> None:
+        """
+        429 в одном чате останавливает только этот чат, не весь бот.
+        """
+        now = time.monotonic()
+        if len(self._chat_pauses) >= self.max_chats:
+            for key in [k for k, until in self._chat_pauses.items() if until <= now]:
+                del self._chat_pauses[key]
+        self._chat_pauses[chat_id] = max(self._chat_pauses.get(chat_id, 0.0), now + seconds)
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            bucket.pause(seconds)
+
+    async def _wait_chat_pause(self, chat_id: int | str) -> None:
+        until = self._chat_pauses.get(chat_id)
+        if until is None:
+            return
+        delay = until - time.monotonic()
+        if delay <= 0:
+            self._chat_pauses.pop(chat_id, None)
+            return
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _message_chat(method: TelegramMethod) -> int | str | None:
+        # Лимит на чат у Telegram — на новые сообщения, правки и удаления его не тратят
+        if not method.__api_method__.startswith(("send", "copy", "forward")):
+            return None
+        return getattr(method, "chat_id", None)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        priority = request_priority.get()
+        if isinstance(method, SendDocument):
+            priority = max(priority, BULK)
+        # Чат запроса (для паузы на 429) и его лимит сообщений (только для отправки)
+        chat_id = getattr(method, "chat_id", None)
+        message_chat = self._message_chat(method)
+        chat_bucket = self.chat_bucket(message_chat) if message_chat is not None else None
+
+        self.requests += 1
+        if caller_throttled.get():
+            # Токен чата уже взят, пауза и повтор на 429 — забота вызывающего
+            await self.bucket.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter:
+                self.throttled += 1
+                raise
+
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._wait_chat_pause(chat_id)
+            if chat_bucket is not None:
+                await chat_bucket.acquire(priority)
+            await self.bucket.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.throttled += 1
+                # Общее ведро встаёт, только если запрос не привязан к чату
+                if chat_id is not None:
+                    self.pause_chat(chat_id, e.retry_after)
+                else:
+                    self.bucket.pause(e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                self.retried += 1
+                # Повтор идёт впереди запросов того же приоритета, чтобы
+                # сообщения в чате не переставлялись
+                priority -= 1
+                logger.warning(
+                    "Bot API: флуд-лимит на %s (чат %s), повтор через %s с",
+                    method.__api_method__, chat_id, e.retry_after,
+                )
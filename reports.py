@@ -0,0 +1,382 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import IO, Any, Iterable, Iterator
+
+from openpyxl import Workbook
+
+# Модуль импортируется в процессах-рендерерах, поэтому здесь
+# не должно быть побочных эффектов при импорте (бот, база, хендлеры).
+
+# Колонки выгрузки в порядке SELECT
+TICKET_COLUMNS = [
+    "id",
+    "created_at",
+    "user_id",
+    "username",
+    "employees",
+    "date",
+    "venue",
+    "play",
+    "problem",
+    "cause",
+]
+
+# Сколько строк забираем из курсора за раз при потоковой выгрузке
+FETCH_CHUNK = 500
+
+
+def month_bounds(year_month: str) -> tuple[str, str]:
+    """
+    Границы месяца YYYY-MM для индексируемого запроса:
+    date >= начало AND date < начало следующего месяца.
+    """
+    year, month = map(int, year_month.split("-"))
+    if month == 12:
+        next_year, next_month = year + 1, 1
+    else:
+        next_year, next_month = year, month + 1
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+def tickets_where(
+    filter_date: str | None = None,
+    filter_play: str | None = None,
+    filter_employee: str | None = None,
+    year_month: str | None = None,
+) -> tuple[str, list[Any]]:
+    """
+    Условие WHERE (или пустая строка) и параметры выборки отчёта.
+    """
+    conditions: list[str] = []
+    params: list[Any] = []
+
+    if filter_date:
+        conditions.append("date = ?")
+        params.append(filter_date)
+
+    if year_month:
+        conditions.append("date >= ? AND date < ?")
+        params.extend(month_bounds(year_month))
+
+    if filter_play:
+        conditions.append("play = ?")
+        params.append(filter_play)
+
+    if filter_employee:
+        conditions.append(
+            "id IN (SELECT ticket_id FROM ticket_employees WHERE employee = ?)"
+        )
+        params.append(filter_employee)
+
+    if not conditions:
+        return "", params
+    return " WHERE " + " AND ".join(conditions), params
+
+
+def tickets_query(**filters) -> tuple[str, list[Any]]:
+    """
+    SQL и параметры выборки обращений для отчёта.
+    """
+    where, params = tickets_where(**filters)
+    query = "SELECT " + ", ".join(TICKET_COLUMNS) + " FROM tickets" + where + " ORDER BY id"
+    return query, params
+
+
+def report_version(conn, **filters) -> tuple[int, str]:
+    """
+    Версия данных отчёта: (число обращений, «число:максимальный id»).
+    Обращения только добавляются, поэтому версия меняется ровно тогда,
+    когда в выборку попало новое обращение. Считается по индексам.
+    """
+    where, params = tickets_where(**filters)
+    count, max_id = conn.execute(
+        "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM tickets" + where, params
+    ).fetchone()
+    return count, f"{count}:{max_id}"
+
+
+def latest_ticket_id(conn) -> int:
+    """
+    Глобальная версия данных: последний id обращения. Берётся из конца
+    B-дерева таблицы, без просмотра строк.
+    """
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM tickets").fetchone()[0]
+
+
+class ReportVersions:
+    """
+    Запомненные версии отчётов (report_version) вместе с глобальной
+    версией, при которой они посчитаны. Обращения только добавляются,
+    поэтому, пока latest_ticket_id() не сдвинулся, версия любой выборки
+    та же, и COUNT(*) по ней не нужен: повторный запрос отчёта (из кэша
+    или по file_id) обходится одним чтением конца индекса.
+
+    Вызывается из читающих потоков Database — отсюда блокировка.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        # ключ отчёта -> (глобальная версия, число обращений, версия отчёта)
+        self._entries: OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, **filters) -> tuple[int, str]:
+        key = report_key(filters)
+        latest = latest_ticket_id(conn)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == latest:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        # latest прочитан до подсчёта: если обращение добавится между ними,
+        # следующий запрос увидит новый latest и просто пересчитает
+        count, version = report_version(conn, **filters)
+        with self._lock:
+            self._entries[key] = (latest, count, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return count, version
+
+
+def iter_tickets(conn, chunk_size: int = FETCH_CHUNK, **filters) -> Iterator[tuple]:
+    """
+    Строки выборки порциями по chunk_size — без fetchall() всей таблицы.
+    """
+    query, params = tickets_query(**filters)
+    cur = conn.execute(query, params)
+    try:
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                return
+            yield from chunk
+    finally:
+        cur.close()
+
+
+def write_tickets_xlsx(rows: Iterable[tuple], fileobj: IO[bytes]) -> int:
+    """
+    Пишет отчёт в fileobj в write-only режиме openpyxl: строки сразу
+    уходят во временный XML на диске, память не растёт с размером отчёта.
+    Возвращает число строк с обращениями.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Обращения")
+    ws.append(TICKET_COLUMNS)
+
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+
+    wb.save(fileobj)
+    return count
+
+
+# Соединение с базой в процессе-рендерере (своё на каждый процесс)
+_worker_conn: sqlite3.Connection | None = None
+
+
+def _get_worker_conn(db_path: str) -> sqlite3.Connection:
+    global _worker_conn
+    if _worker_conn is None:
+        _worker_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    return _worker_conn
+
+
+def render_report_file(db_path: str, **filters) -> tuple[str | None, int]:
+    """
+    Выполняется в процессе-рендерере: выгружает отчёт во временный
+    xlsx-файл и возвращает (путь, число строк). Если обращений нет —
+    файл не создаётся, путь None.
+    """
+    conn = _get_worker_conn(db_path)
+    fd, path = tempfile.mkstemp(prefix="tickets_report_", suffix=".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            count = write_tickets_xlsx(iter_tickets(conn, **filters), file)
+    except Exception:
+        os.remove(path)
+        raise
+
+    if not count:
+        os.remove(path)
+        return None, 0
+    return path, count
+
+
+class ReportQueueFull(Exception):
+    pass
+
+
+class ReportFailed(Exception):
+    """
+    Процесс сборки умер посреди отчёта (например, убит по OOM).
+    """
+
+
+class ReportRenderer:
+    """
+    Ограниченный пул процессов для сборки xlsx: openpyxl — чистый Python
+    и держит GIL, поэтому в основном процессе отчёт тормозил бы все
+    остальные апдейты. Сверх workers + max_queue отчётов новые не принимаем.
+    """
+
+    def __init__(self, db_path: str, workers: int = 2, max_queue: int = 4):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor: ProcessPoolExecutor | None = None
+
+        # Отчёты в работе + ожидающие свободного процесса
+        self.pending = 0
+
+        # Метрики
+        self.rendered = 0
+        self.failed = 0
+        self.rejected = 0
+        # Суммарное время сборки (сек), включая неудачные — только растёт
+        self.seconds = 0.0
+        self.max_time = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forkserver: процессы порождаются из чистого сервера, а не
+            # форком основного процесса с его потоками и соединениями.
+            # Заранее грузится только этот модуль, но каждый процесс ещё
+            # импортирует __main__ родителя — поэтому им не должен быть
+            # файл, тянущий bot_core (см. web_app: запуск через aiohttp.web)
+            methods = multiprocessing.get_all_start_methods()
+            if "forkserver" in methods:
+                ctx = multiprocessing.get_context("forkserver")
+                ctx.set_forkserver_preload([__name__])
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        return self._executor
+
+    @property
+    def busy(self) -> bool:
+        return self.pending >= self.workers + self.max_queue
+
+    async def render(self, **filters) -> tuple[str | None, int]:
+        """
+        Собирает отчёт в пуле процессов, возвращает (путь к файлу, число строк).
+        Файл после отправки удаляет вызывающий.
+        """
+        if self.busy:
+            self.rejected += 1
+            raise ReportQueueFull()
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(render_report_file, self.db_path, **filters)
+        executor = self._get_executor()
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(executor, call)
+        except BrokenProcessPool as e:
+            # Сломанный пул не оживёт: выбрасываем его, следующий отчёт
+            # соберёт новый (если его ещё не пересоздал параллельный вызов)
+            self.failed += 1
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            raise ReportFailed() from e
+        except Exception:
+            self.failed += 1
+            raise
+        else:
+            self.rendered += 1
+            return result
+        finally:
+            self.pending -= 1
+            elapsed = time.perf_counter() - start
+            self.seconds += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def report_key(filters: dict) -> str:
+    """
+    Ключ отчёта: тип (набор фильтров) + значения фильтров.
+    """
+    return "&".join(f"{k}={v}" for k, v in sorted(filters.items()) if v) or "all"
+
+
+class ReportCache:
+    """
+    LRU-кэш готовых xlsx по (ключ отчёта, версия данных) с ограничением
+    по числу записей и суммарному размеру. Версия — report_version(),
+    так что запись перестаёт совпадать, только когда в её выборку
+    попадает новое обращение (в том числе записанное другим процессом).
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Крупные отчёты не кэшируем, чтобы один не вытеснял все остальные
+        self.max_entry_bytes = max_bytes // 4
+
+        self._entries: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self.size = 0
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str, version: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != version:
+            # В выборке появились новые обращения
+            self._drop(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, version: str, data: bytes) -> None:
+        if len(data) > self.max_entry_bytes:
+            return
+
+        self._drop(key)
+        self._entries[key] = (version, data)
+        self.size += len(data)
+
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+def test_pending_state_is_saved_on_close(tmp_path):
+    path = str(tmp_path / "fsm.db")
+
+    async def scenario():
+        storage = SQLiteStorage(path)
+        await storage.set_state(KEY, "Form:date")
+        await storage.close()
+
+        storage = SQLiteStorage(path)
+        state = await storage.get_state(KEY)
+        await storage.close()
+        return state
+
+    assert asyncio.run(scenario()) == "Form:date"
+
+
+def test_close_gives_up_on_unwritable_storage(tmp_path, caplog):
+    storage = SQLiteStorage(str(tmp_path / "fsm.db"))
+
+    def fail(records):
+        raise OSError("database or disk is full")
+
+    storage._write = fail
+
+    async def scenario():
+        await storage.set_state(KEY, "Form:date")
+        start = time.monotonic()
+        await storage.close(timeout=0.3)
+        return time.monotonic() - start
+
+    with caplog.at_level(logging.WARNING):
+        elapsed = asyncio.run(scenario())
+    assert elapsed < 1
+    assert "не сохранены состояния" in caplog.text
+    assert storage._dirty
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageReplyMarkup, SendMessage
+
+from ratelimit import RateLimitMiddleware, self_throttled
+
+
+def flood_then_ok(floods: int):
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method)
+        if len(calls) <= floods:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.01)
+        return "ok"
+
+    return make_request, calls
+
+
+def test_flood_wait_is_retried_by_scheduler():
+    limiter = RateLimitMiddleware()
+    make_request, calls = flood_then_ok(1)
+    method = SendMessage(chat_id=-100, text="x")
+
+    assert asyncio.run(limiter(make_request, None, method)) == "ok"
+    assert len(calls) == 2
+    assert limiter.retried == 1
+
+
+def test_self_throttled_request_is_not_retried():
+    limiter = RateLimitMiddleware()
+    make_request, calls = flood_then_ok(1)
+    method = SendMessage(chat_id=-100, text="x")
+
+    async def send():
+        with self_throttled():
+            return await limiter(make_request, None, method)
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(send())
+    assert len(calls) == 1
+    assert limiter.retried == 0
+    assert limiter.throttled == 1
+
+
+
+def test_flood_wait_on_edit_pauses_only_that_chat():
+    limiter = RateLimitMiddleware()
+    flooded = set()
+
+    async def make_request(bot, method):
+        if isinstance(method, EditMessageReplyMarkup) and method.chat_id not in flooded:
+            flooded.add(method.chat_id)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.5)
+        return "ok"
+
+    async def scenario():
+        edit = asyncio.create_task(
+            limiter(make_request, None, EditMessageReplyMarkup(chat_id=111, message_id=1))
+        )
+        await asyncio.sleep(0.05)
+        # Пока чат 111 на паузе, другой чат обслуживается сразу
+        start = time.monotonic()
+        await limiter(make_request, None, SendMessage(chat_id=222, text="x"))
+        other_delay = time.monotonic() - start
+
+        start = time.monotonic()
+        assert await edit == "ok"
+        return other_delay, time.monotonic() - start
+
+    other_delay, edit_wait = asyncio.run(scenario())
+    assert other_delay < 0.1
+    assert edit_wait > 0.3
+    assert limiter.retried == 1
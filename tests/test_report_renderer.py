@@ -0,0 +1,47 @@
+import asyncio
+import os
+import signal
+import sqlite3
+
+import pytest
+
+from reports import TICKET_COLUMNS, ReportFailed, ReportRenderer
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "tickets.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE tickets (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        + ", ".join(f"{c} TEXT" for c in TICKET_COLUMNS[1:]) + ")"
+    )
+    conn.execute("INSERT INTO tickets (date, play) VALUES ('2025-01-01', 'A')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_dead_worker_fails_one_report_and_pool_recovers(db_path):
+    renderer = ReportRenderer(db_path, workers=1)
+
+    async def scenario():
+        path, count = await renderer.render()
+        os.remove(path)
+        assert count == 1
+
+        # Процесс сборки убит (как при OOM)
+        for pid in list(renderer._executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        with pytest.raises(ReportFailed):
+            await renderer.render()
+
+        path, count = await renderer.render()
+        os.remove(path)
+        assert count == 1
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        renderer.close()
+    assert (renderer.rendered, renderer.failed) == (2, 1)
@@ -0,0 +1,27 @@
+import sqlite3
+
+from reports import ReportVersions
+
+
+def tickets_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE tickets (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, play TEXT)")
+    conn.executemany("INSERT INTO tickets (date, play) VALUES (?, ?)", [("2025-01-01", "A"), ("2025-01-02", "B")])
+    return conn
+
+
+def test_version_is_reused_until_new_ticket():
+    conn = tickets_db()
+    versions = ReportVersions()
+
+    assert versions.get(conn, filter_play="A") == (1, "1:1")
+    assert versions.get(conn, filter_play="A") == (1, "1:1")
+    assert (versions.hits, versions.misses) == (1, 1)
+
+    # Новое обращение в другой выборке: версия та же, но пересчитана
+    conn.execute("INSERT INTO tickets (date, play) VALUES ('2025-01-03', 'B')")
+    assert versions.get(conn, filter_play="A") == (1, "1:1")
+    assert versions.misses == 2
+
+    conn.execute("INSERT INTO tickets (date, play) VALUES ('2025-01-04', 'A')")
+    assert versions.get(conn, filter_play="A") == (2, "2:4")
@@ -0,0 +1,71 @@
+import asyncio
+
+from aiogram.types import Update
+
+from update_queue import UpdateQueue, update_chat_id
+
+
+def message_update(update_id: int, chat_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": "hi",
+        },
+    })
+
+
+def test_unknown_update_type_has_no_chat():
+    assert update_chat_id(Update.model_validate({"update_id": 1})) is None
+
+
+def test_unknown_update_type_does_not_kill_workers():
+    async def scenario():
+        handled = []
+
+        async def handler(update: Update) -> None:
+            handled.append(update.update_id)
+
+        queue = UpdateQueue(handler, workers=1)
+        queue.start()
+        # Апдейты неизвестного типа — больше, чем воркеров
+        for i in range(1, 4):
+            assert queue.put(Update.model_validate({"update_id": i}))
+        assert queue.put(message_update(10, chat_id=42))
+
+        await asyncio.wait_for(queue._idle.wait(), 1)
+        assert all(not w.done() for w in queue._workers)
+        await queue.stop(timeout=1)
+        return queue, handled
+
+    queue, handled = asyncio.run(scenario())
+    assert handled == [1, 2, 3, 10]
+    assert queue.pending == 0
+    assert queue.failed == 0
+
+
+def test_handler_error_is_counted_and_worker_survives():
+    async def scenario():
+        handled = []
+
+        async def handler(update: Update) -> None:
+            if update.update_id == 1:
+                raise RuntimeError("boom")
+            handled.append(update.update_id)
+
+        queue = UpdateQueue(handler, workers=1)
+        queue.start()
+        queue.put(message_update(1, chat_id=42))
+        queue.put(message_update(2, chat_id=42))
+        await asyncio.wait_for(queue._idle.wait(), 1)
+        await queue.stop(timeout=1)
+        return queue, handled
+
+    queue, handled = asyncio.run(scenario())
+    assert handled == [2]
+    assert queue.failed == 1
+    assert queue.processed == 1
+    assert queue.pending == 0
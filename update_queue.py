@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable
+
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update: Update) -> int | None:
+    """
+    Чат, к которому относится апдейт (для колбэков — чат сообщения с кнопками).
+    """
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        # Тип апдейта, которого эта версия aiogram не знает (новее Bot API)
+        return None
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        message = getattr(event, "message", None)
+        chat = getattr(message, "chat", None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None)
+    return user.id if user else None
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь апдейтов с пулом воркеров.
+    Апдейты одного чата обрабатываются строго по порядку и никогда
+    одновременно, разные чаты — параллельно.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Update], Awaitable[None]],
+        workers: int = 8,
+        maxsize: int = 1000,
+    ):
+        self._handler = handler
+        self._workers_count = max(1, workers)
+        self.maxsize = maxsize
+
+        self._queue: asyncio.Queue[Update] = asyncio.Queue()
+        # Чаты, чей апдейт сейчас в работе -> их отложенные апдейты
+        self._busy_chats: dict[int, deque[Update]] = {}
+        self._workers: list[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        # Апдейты в очереди + отложенные + в обработке
+        self.pending = 0
+
+        # Метрики
+        self.enqueued = 0
+        # Обработанные успешно; упавшие считаются только в failed
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_pending = 0
+
+    def start(self) -> None:
+        for i in range(self._workers_count):
+            self._workers.append(
+                asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            )
+
+    async def stop(self, timeout: float = 30) -> None:
+        """
+        Дожидается обработки принятых апдейтов и останавливает воркеры.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не дождались обработки %s апдейтов", self.pending)
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def put(self, update: Update) -> bool:
+        """
+        Ставит апдейт в очередь. False — очередь переполнена.
+        """
+        if self.pending >= self.maxsize:
+            self.dropped += 1
+            return False
+
+        self.pending += 1
+        self.enqueued += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        self._idle.clear()
+        self._queue.put_nowait(update)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._dispatch(update)
+            except Exception:
+                # Воркер не должен умирать: иначе очередь перестанет разбираться
+                logger.exception("Воркер: сбой при разборе апдейта %s", update.update_id)
+
+    async def _dispatch(self, update: Update) -> None:
+        try:
+            chat_id = update_chat_id(update)
+        except Exception:
+            logger.exception("Не удалось определить чат апдейта %s", update.update_id)
+            chat_id = None
+
+        if chat_id is None:
+            await self._process(update)
+            return
+
+        backlog = self._busy_chats.get(chat_id)
+        if backlog is not None:
+            # Чат уже обрабатывает другой воркер — он заберёт и этот апдейт
+            backlog.append(update)
+            return
+
+        backlog = self._busy_chats[chat_id] = deque()
+        try:
+            while True:
+                await self._process(update)
+                if not backlog:
+                    break
+                update = backlog.popleft()
+        finally:
+            del self._busy_chats[chat_id]
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self._handler(update)
+        except Exception:
+            self.failed += 1
+            logger.exception("Ошибка при обработке апдейта %s", update.update_id)
+        else:
+            self.processed += 1
+        finally:
+            self.pending -= 1
+            if self.pending == 0:
+                self._idle.set()
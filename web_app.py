@@ -1,16 +1,45 @@
 import os
-import asyncio
+import sys
+import hmac
+import logging
 
-from flask import Flask, request
+from aiohttp import web
 from aiogram.types import Update
+from pydantic import ValidationError
 
-from bot_core import bot, dp, WEBHOOK_PATH, WEBHOOK_URL
+from bot_core import (
+    bot,
+    dp,
+    db,
+    report_renderer,
+    outbox_sender,
+    update_profiler,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+)
+from loop_monitor import LoopMonitor, loop_monitor_collector
+from metrics import registry
+from update_queue import UpdateQueue
 
-app = Flask(__name__)
+# Запуск под gunicorn: aiohttp-воркер вместо WSGI задан в gunicorn.conf.py,
+# поэтому достаточно `gunicorn web_app:app`
 
-# Глобальный event loop для всего приложения
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
+logger = logging.getLogger(__name__)
+
+# Число воркеров, разбирающих апдейты, и предел очереди
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+
+# Если задан — /metrics отдаётся только с заголовком Authorization: Bearer <токен>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Замер задержки event loop: период замера и порог, после которого
+# в лог пишется стек того, что держит loop (0 — без сторожевого потока)
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+
+# Токен админских отладочных эндпоинтов (/debug/...). Не задан — их нет
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 # Флаг, чтобы не дёргать set_webhook лишний раз
 webhook_set = False
@@ -31,25 +60,142 @@ async def process_update(update: Update):
     """
     Обработка апдейта от Telegram.
     """
-    await ensure_webhook()
     await dp.feed_update(bot, update)
 
 
-@app.route("/", methods=["GET"])
-def index():
+update_queue = UpdateQueue(
+    process_update,
+    workers=UPDATE_WORKERS,
+    maxsize=UPDATE_QUEUE_SIZE,
+)
+registry.attributes(
+    "bot_update_queue", update_queue,
+    counters=["enqueued", "processed", "failed", "dropped"],
+    gauges=["pending", "max_pending"],
+)
+
+loop_monitor = LoopMonitor(
+    interval=LOOP_LAG_INTERVAL_MS / 1000,
+    threshold=LOOP_BLOCK_THRESHOLD_MS / 1000,
+)
+loop_monitor_collector(loop_monitor)
+
+
+async def index(request: web.Request) -> web.Response:
     # При первом заходе на корень выставляем webhook
-    loop.run_until_complete(ensure_webhook())
-    return "Telegram bot is running."
+    await ensure_webhook()
+    return web.Response(text="Telegram bot is running.")
+
+
+async def telegram_webhook(request: web.Request) -> web.Response:
+    try:
+        json_data = await request.json()
+        update = Update.model_validate(json_data, context={"bot": bot})
+    except (ValueError, ValidationError):
+        return web.Response(status=400, text="Bad Request")
+
+    # Отвечаем Telegram сразу, сам апдейт разберёт пул воркеров.
+    # При переполнении просим Telegram повторить доставку позже.
+    if not update_queue.put(update):
+        logger.warning("Очередь апдейтов переполнена, апдейт %s отклонён", update.update_id)
+        return web.Response(status=503, text="Busy")
+    return web.Response(text="OK")
+
+
+def has_token(request: web.Request, token: str) -> bool:
+    """
+    Заголовок Authorization: Bearer <token>; сравнение за постоянное время.
+    """
+    header = request.headers.get("Authorization", "")
+    return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+async def metrics(request: web.Request) -> web.Response:
+    if METRICS_TOKEN and not has_token(request, METRICS_TOKEN):
+        return web.Response(status=401, text="Unauthorized")
+    return web.Response(text=registry.render(), content_type="text/plain")
+
+
+async def profiles_list(request: web.Request) -> web.Response:
+    if not has_token(request, ADMIN_TOKEN):
+        return web.Response(status=401, text="Unauthorized")
+    return web.json_response([p.summary() for p in reversed(update_profiler.profiles)])
+
+
+async def profile_download(request: web.Request) -> web.Response:
+    if not has_token(request, ADMIN_TOKEN):
+        return web.Response(status=401, text="Unauthorized")
+    try:
+        profile = update_profiler.get(int(request.match_info["profile_id"]))
+    except ValueError:
+        profile = None
+    if profile is None:
+        return web.Response(status=404, text="Not Found")
+    return web.Response(
+        text=profile.collapsed(),
+        content_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="update-{profile.id}.folded"'},
+    )
+
+
+async def on_startup(app: web.Application):
+    # HTTP-сессия бота живёт столько же, сколько приложение (закрывается в on_shutdown)
+    await bot.session.create_session()
+    loop_monitor.start()
+    update_queue.start()
+    outbox_sender.start()
+    try:
+        await ensure_webhook()
+    except Exception:
+        # Не роняем приложение: webhook выставится при заходе на «/»
+        logger.exception("Не удалось установить webhook при старте")
+
+
+async def on_shutdown(app: web.Application):
+    # Даём дообработаться уже принятым апдейтам
+    await update_queue.stop()
+    # И текущей отправке уведомления, пока сессия бота ещё открыта
+    await outbox_sender.stop()
+    await loop_monitor.stop()
+    await dp.storage.close()
+    await bot.session.close()
+    report_renderer.close()
+    if update_profiler is not None:
+        update_profiler.close()
+    db.close()
+
+
+def create_app(argv: list[str] | None = None) -> web.Application:
+    # argv передаёт только `python -m aiohttp.web` — это локальный запуск
+    if argv is not None:
+        logging.basicConfig(level=logging.INFO)
+    application = web.Application()
+    application.router.add_get("/", index)
+    application.router.add_get("/metrics", metrics)
+    if update_profiler is not None and ADMIN_TOKEN:
+        # Профили медленных апдейтов: список и выгрузка в формате flamegraph
+        application.router.add_get("/debug/profiles", profiles_list)
+        application.router.add_get("/debug/profiles/{profile_id}", profile_download)
+    application.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    application.on_startup.append(on_startup)
+    application.on_shutdown.append(on_shutdown)
+    return application
 
 
-@app.route(WEBHOOK_PATH, methods=["POST"])
-def telegram_webhook():
-    json_data = request.get_json(force=True)
-    update = Update.model_validate(json_data)
-    loop.run_until_complete(process_update(update))
-    return "OK"
+app = create_app()
 
 
 if __name__ == "__main__":
-    # Локальный запуск (для отладки)
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
\ No newline at end of file
+    # Локальный запуск (для отладки). Процессы сборки отчётов (forkserver)
+    # заново импортируют __main__ процесса-родителя; если им остаётся этот
+    # файл, каждый такой процесс поднимал бы весь bot_core (бота, миграции,
+    # FSM). Поэтому перезапускаемся через aiohttp.web: тогда __main__ —
+    # модуль aiohttp, а web_app грузится только здесь, в основном процессе.
+    #   python -m aiohttp.web -H 0.0.0.0 -P 8000 web_app:create_app
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [here, os.getenv("PYTHONPATH")]))
+    os.execv(sys.executable, [
+        sys.executable, "-m", "aiohttp.web",
+        "-H", "0.0.0.0", "-P", os.getenv("PORT", "8000"),
+        "web_app:create_app",
+    ])